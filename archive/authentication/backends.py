@@ -1,9 +1,21 @@
 from django.contrib.auth.models import User
-from archive.authentication.models import Profile
+from archive.authentication.models import Profile, get_oauth_profile
+from archive.authentication.exceptions import AuthServerUnavailable
+from archive import metrics
 from django.conf import settings
+from django.core.cache import cache
 from rest_framework import authentication, exceptions
 from ocs_authentication.auth_profile.models import AuthProfile
+from hashlib import blake2b
 import requests
+import logging
+
+logger = logging.getLogger()
+
+
+def bearer_cache_key(bearer):
+    # Never store the raw token in the cache key, since keys can show up in cache server logs
+    return 'bearer_auth_{}'.format(blake2b(bearer.encode('utf-8'), digest_size=32).hexdigest())
 
 
 class BearerAuthentication(authentication.BaseAuthentication):
@@ -17,27 +29,58 @@ class BearerAuthentication(authentication.BaseAuthentication):
             return None
 
         bearer = auth_header.split('Bearer')[1].strip()
-        response = requests.get(
-            settings.OCS_AUTHENTICATION['OAUTH_PROFILE_URL'],
-            headers={'Authorization': 'Bearer {}'.format(bearer)}
-        )
+
+        # The resolved user is cached per token so that repeated calls with the same token
+        # don't hit the auth server and write to the database on every request
+        cache_key = bearer_cache_key(bearer)
+        user_id = cache.get(cache_key)
+        if user_id is not None:
+            try:
+                user = User.objects.get(pk=user_id)
+                metrics.AUTH_CACHE.labels('bearer', 'hit').inc()
+                return (user, None)
+            except User.DoesNotExist:
+                cache.delete(cache_key)
+        metrics.AUTH_CACHE.labels('bearer', 'miss').inc()
+
+        try:
+            response = get_oauth_profile('Bearer {}'.format(bearer))
+        except requests.exceptions.RequestException as e:
+            logger.warning('Failed to authenticate bearer token against the oauth server: {}'.format(repr(e)))
+            raise AuthServerUnavailable()
 
         if not response.status_code == 200:
             raise exceptions.AuthenticationFailed('No Such User')
 
-        profile = response.json()
-        user, _ = User.objects.get_or_create(username=profile['username'])
-        Profile.objects.update_or_create(
-            user=user,
-            defaults={
-                'access_token': bearer,
-            }
-        )
-        AuthProfile.objects.update_or_create(user=user,
-            defaults={
-                'staff_view': profile.get('profile', {}).get('staff_view', False),
-                'api_token': profile.get('tokens', {}).get('api_token')
-            }
-        )
+        user = self.update_user(response.json(), bearer)
+        cache.set(cache_key, user.id, settings.BEARER_AUTH_CACHE_TIMEOUT)
 
         return (user, None)
+
+    def update_user(self, profile, bearer):
+        """
+        Get or create the user for the given profile, only writing the Profile and AuthProfile
+        rows if the values returned by the auth server differ from the ones we have stored.
+        """
+        user, _ = User.objects.get_or_create(username=profile['username'])
+
+        user_profile, created = Profile.objects.get_or_create(user=user, defaults={'access_token': bearer})
+        if not created and user_profile.access_token != bearer:
+            user_profile.access_token = bearer
+            user_profile.save(update_fields=['access_token'])
+
+        auth_profile_values = {
+            'staff_view': profile.get('profile', {}).get('staff_view', False),
+            'api_token': profile.get('tokens', {}).get('api_token')
+        }
+        auth_profile, created = AuthProfile.objects.get_or_create(user=user, defaults=auth_profile_values)
+        if not created:
+            changed_fields = [
+                field for field, value in auth_profile_values.items() if getattr(auth_profile, field) != value
+            ]
+            if changed_fields:
+                for field in changed_fields:
+                    setattr(auth_profile, field, auth_profile_values[field])
+                auth_profile.save(update_fields=changed_fields)
+
+        return user
@@ -0,0 +1,7 @@
+from rest_framework.exceptions import APIException
+
+
+class AuthServerUnavailable(APIException):
+    status_code = 503
+    default_detail = 'The authentication server could not be reached. Please try again later.'
+    default_code = 'auth server unavailable'
@@ -6,13 +6,27 @@ from django.dispatch import receiver
 from django.core.cache import cache
 from rest_framework.authtoken.models import Token
 from ocs_authentication.auth_profile.models import AuthProfile
+from concurrent.futures import ThreadPoolExecutor
+import threading
 import requests
 import logging
+import time
 
+from archive import http_client, metrics
 from archive.frames.utils import get_cached_frames_aggregates
 
 logger = logging.getLogger()
 
+_refresh_executor = None
+_refresh_executor_lock = threading.Lock()
+
+
+def get_oauth_profile(authorization):
+    """
+    Get the user profile from the oauth server, using the given Authorization header value
+    """
+    return http_client.get(settings.OCS_AUTHENTICATION['OAUTH_PROFILE_URL'], headers={'Authorization': authorization})
+
 
 def get_all_proposals():
     all_aggregates = get_cached_frames_aggregates()
@@ -21,41 +35,122 @@ def get_all_proposals():
 
     return []
 
+
+def proposals_cache_key(user_id):
+    return 'user_proposals_{0}'.format(user_id)
+
+
+def get_refresh_executor():
+    global _refresh_executor
+    if _refresh_executor is None:
+        with _refresh_executor_lock:
+            if _refresh_executor is None:
+                _refresh_executor = ThreadPoolExecutor(
+                    max_workers=settings.PROPOSALS_CACHE_REFRESH_WORKERS, thread_name_prefix='proposals-refresh'
+                )
+    return _refresh_executor
+
+
+def fetch_proposals(authorization, username):
+    """
+    Get the proposals a user is a member of from the oauth server. Returns a tuple of the
+    list of proposal ids and whether the oauth server gave a definitive answer.
+    """
+    try:
+        response = get_oauth_profile(authorization)
+    except requests.exceptions.RequestException as e:
+        logger.warning(
+            'Failed to get user proposals from the oauth server: {}'.format(repr(e)),
+            extra={'tags': {'username': username}}
+        )
+        return [], False
+    if response.status_code == 200:
+        return [proposal['id'] for proposal in response.json()['proposals']], True
+    if response.status_code >= 500:
+        logger.warning(
+            'Oauth server returned an error getting user proposals',
+            extra={'tags': {'username': username, 'status_code': response.status_code}}
+        )
+        return [], False
+    logger.warning('User api token was invalid!', extra={'tags': {'username': username}})
+    return [], True
+
+
+def cache_proposals(user_id, proposals, fresh_seconds, timeout=None):
+    # The entry is kept past fresh_until, so it can be served stale while it is refreshed
+    if timeout is None:
+        timeout = settings.PROPOSALS_CACHE_MAX_STALE_SECONDS
+    entry = {'proposals': proposals, 'fresh_until': time.time() + fresh_seconds}
+    cache.set(proposals_cache_key(user_id), entry, timeout)
+
+
+def refresh_proposals(user_id, authorization, username, stale_proposals):
+    """
+    Refresh the cached proposals for a user. Runs outside of the request, so it is given
+    everything it needs up front and does not touch the database. If the oauth server can't be
+    reached, the stale proposals are kept and the refresh is retried after a short while.
+    """
+    try:
+        proposals, ok = fetch_proposals(authorization, username)
+        if ok:
+            cache_proposals(user_id, proposals, settings.PROPOSALS_CACHE_TIMEOUT)
+        else:
+            cache_proposals(user_id, stale_proposals, settings.PROPOSALS_CACHE_FAILURE_TIMEOUT)
+    finally:
+        cache.delete(proposals_cache_key(user_id) + '_lock')
+
+
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     access_token = models.CharField(max_length=255, default='')
     refresh_token = models.CharField(max_length=255, default='')
 
+    def get_authorization(self):
+        # TODO: Remove the bearer token fallback once we have deprecated their use
+        try:
+            authprofile = AuthProfile.objects.get(user=self.user)
+            return 'Token {}'.format(authprofile.api_token)
+        except AuthProfile.DoesNotExist:
+            return 'Bearer {}'.format(self.access_token)
+
     @property
     def proposals(self):
         if self.user.is_superuser:
-            proposals = get_all_proposals()
+            return get_all_proposals()
+
+        # Cached proposals are served even once they are stale, while a single background
+        # refresh per user updates them. Only a user with nothing cached waits on the oauth server.
+        entry = cache.get(proposals_cache_key(self.user.id))
+        if entry is None:
+            metrics.AUTH_CACHE.labels('proposals', 'miss').inc()
+            proposals, ok = fetch_proposals(self.get_authorization(), self.user.username)
+            if ok:
+                cache_proposals(self.user.id, proposals, settings.PROPOSALS_CACHE_TIMEOUT)
+            else:
+                # Nothing to serve stale, so the next request after the failure timeout fetches them again
+                cache_proposals(
+                    self.user.id, proposals, settings.PROPOSALS_CACHE_FAILURE_TIMEOUT,
+                    timeout=settings.PROPOSALS_CACHE_FAILURE_TIMEOUT
+                )
+            return proposals
+
+        if entry['fresh_until'] > time.time():
+            metrics.AUTH_CACHE.labels('proposals', 'hit').inc()
         else:
-            cache_key = '{0}_proposals'.format(self.user.id)
-            proposals = cache.get(cache_key)
-            if not proposals:
-                proposals = []
-                # TODO: Remove the bearer token fallback once we have deprecated their use
+            metrics.AUTH_CACHE.labels('proposals', 'stale').inc()
+            lock_timeout = (
+                settings.HTTP_CLIENT_CONNECT_TIMEOUT_SECONDS + settings.HTTP_CLIENT_READ_TIMEOUT_SECONDS + 5
+            )
+            if cache.add(proposals_cache_key(self.user.id) + '_lock', True, lock_timeout):
                 try:
-                    authprofile = AuthProfile.objects.get(user=self.user)
-                    response = requests.get(
-                        settings.OCS_AUTHENTICATION['OAUTH_PROFILE_URL'],
-                        headers={'Authorization': 'Token {}'.format(authprofile.api_token)}
-                    )
-                except AuthProfile.DoesNotExist:
-                    response = requests.get(
-                        settings.OCS_AUTHENTICATION['OAUTH_PROFILE_URL'],
-                        headers={'Authorization': 'Bearer {}'.format(self.access_token)}
-                    )
-                if response.status_code == 200:
-                    proposals = [proposal['id'] for proposal in response.json()['proposals']]
-                else:
-                    logger.warning(
-                        'User api token was invalid!',
-                        extra={'tags': {'username': self.user.username}}
+                    get_refresh_executor().submit(
+                        refresh_proposals, self.user.id, self.get_authorization(), self.user.username,
+                        entry['proposals']
                     )
-                cache.set(cache_key, proposals, 3600)
-        return proposals
+                except RuntimeError:
+                    # The executor is shutting down along with the worker
+                    cache.delete(proposals_cache_key(self.user.id) + '_lock')
+        return entry['proposals']
 
 
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
@@ -1,11 +1,18 @@
+from archive import health
 from archive.test_helpers import ReplicationTestCase
+from archive.http_client import CircuitBreaker
 from unittest.mock import patch
 from archive.authentication.models import Profile
 from django.contrib.auth.models import User
 from django.conf import settings
 from django.urls import reverse
+from django.core.cache import cache
+from django.test import override_settings
 from ocs_authentication.auth_profile.models import AuthProfile
 import json
+import threading
+import time
+import requests
 import responses
 
 
@@ -36,3 +43,150 @@ class TestUserView(ReplicationTestCase):
         response = self.client.get(reverse('profile'))
         self.assertFalse(response.json()['username'])
         self.assertFalse(response.json()['profile'])
+
+
+class TestBearerAuthentication(ReplicationTestCase):
+    def setUp(self):
+        cache.clear()
+        self.profile_response = {
+            'username': 'bilbo',
+            'profile': {'staff_view': False},
+            'tokens': {'api_token': 'bilbosApiToken'},
+            'proposals': [{'id': 'prop1'}]
+        }
+
+    def add_profile_response(self):
+        responses.add(
+            responses.GET,
+            settings.OCS_AUTHENTICATION['OAUTH_PROFILE_URL'],
+            body=json.dumps(self.profile_response),
+            status=200,
+            content_type='application/json'
+        )
+
+    @responses.activate
+    def test_bearer_auth_creates_user(self):
+        self.add_profile_response()
+        response = self.client.get(reverse('profile'), HTTP_AUTHORIZATION='Bearer aBearerToken')
+        self.assertEqual(response.json()['username'], 'bilbo')
+        user = User.objects.get(username='bilbo')
+        self.assertEqual(user.profile.access_token, 'aBearerToken')
+        self.assertEqual(AuthProfile.objects.get(user=user).api_token, 'bilbosApiToken')
+
+    @responses.activate
+    def test_bearer_auth_is_cached(self):
+        self.add_profile_response()
+        for _ in range(3):
+            response = self.client.get(reverse('profile'), HTTP_AUTHORIZATION='Bearer aBearerToken')
+            self.assertEqual(response.json()['username'], 'bilbo')
+        profile_calls = [
+            call for call in responses.calls
+            if call.request.headers['Authorization'] == 'Bearer aBearerToken'
+        ]
+        self.assertEqual(len(profile_calls), 1)
+
+    @responses.activate
+    def test_bearer_auth_unchanged_profile_is_not_written(self):
+        self.add_profile_response()
+        self.client.get(reverse('profile'), HTTP_AUTHORIZATION='Bearer aBearerToken')
+        cache.clear()
+        with patch.object(AuthProfile, 'save') as auth_profile_save, patch.object(Profile, 'save') as profile_save:
+            self.client.get(reverse('profile'), HTTP_AUTHORIZATION='Bearer aBearerToken')
+        self.assertFalse(auth_profile_save.called)
+        self.assertFalse(profile_save.called)
+
+    @responses.activate
+    def test_bearer_auth_changed_profile_is_written(self):
+        self.add_profile_response()
+        self.client.get(reverse('profile'), HTTP_AUTHORIZATION='Bearer aBearerToken')
+        responses.reset()
+        self.profile_response['tokens']['api_token'] = 'bilbosNewApiToken'
+        self.add_profile_response()
+        self.client.get(reverse('profile'), HTTP_AUTHORIZATION='Bearer anotherBearerToken')
+        user = User.objects.get(username='bilbo')
+        self.assertEqual(user.profile.access_token, 'anotherBearerToken')
+        self.assertEqual(AuthProfile.objects.get(user=user).api_token, 'bilbosNewApiToken')
+
+    @responses.activate
+    def test_bearer_auth_bad_token(self):
+        responses.add(
+            responses.GET,
+            settings.OCS_AUTHENTICATION['OAUTH_PROFILE_URL'],
+            body=json.dumps({'error': 'Bad credentials'}),
+            status=401,
+            content_type='application/json'
+        )
+        response = self.client.get(reverse('profile'), HTTP_AUTHORIZATION='Bearer aBadToken')
+        self.assertEqual(response.status_code, 401)
+
+    @responses.activate
+    def test_bearer_auth_server_unreachable(self):
+        responses.add(
+            responses.GET,
+            settings.OCS_AUTHENTICATION['OAUTH_PROFILE_URL'],
+            body=requests.exceptions.ConnectTimeout()
+        )
+        with patch('archive.http_client.get_circuit_breaker', return_value=CircuitBreaker(100, 30)):
+            response = self.client.get(reverse('profile'), HTTP_AUTHORIZATION='Bearer aBearerToken')
+        self.assertEqual(response.status_code, 503)
+
+
+@patch('archive.health.probe_file_store', return_value={})
+@override_settings(HEALTH_CHECK_CACHE_SECONDS=0)
+class TestDeepHealthCheck(ReplicationTestCase):
+    def setUp(self):
+        running_patcher = patch.dict(health._running, clear=True)
+        running_patcher.start()
+        self.addCleanup(running_patcher.stop)
+
+    def test_healthy(self, probe_file_store_mock):
+        response = self.client.get(reverse('deep-health'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], 'ok')
+        checks = response.json()['checks']
+        self.assertEqual(set(checks), {'database_default', 'cache', 'broker', 'file_store'} | {
+            'database_{}'.format(alias) for alias in settings.REPLICA_DATABASES
+        })
+        self.assertEqual(checks['database_default']['status'], 'ok')
+        self.assertIn('latency_ms', checks['cache'])
+
+    @patch('archive.health.probe_cache', side_effect=ConnectionError('cache is down'))
+    def test_failing_cache_degrades(self, probe_cache_mock, probe_file_store_mock):
+        response = self.client.get(reverse('deep-health'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], 'degraded')
+        self.assertEqual(response.json()['checks']['cache'], {
+            'status': 'error', 'error': 'ConnectionError', 'latency_ms': response.json()['checks']['cache']['latency_ms']
+        })
+
+    def test_failing_file_store_fails(self, probe_file_store_mock):
+        probe_file_store_mock.side_effect = OSError('file store is down')
+        response = self.client.get(reverse('deep-health'))
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()['status'], 'error')
+
+    @override_settings(HEALTH_CHECK_TIMEOUT_SECONDS=0.1)
+    @patch('archive.health.probe_database', return_value={})
+    @patch('archive.health.probe_broker', side_effect=lambda: time.sleep(1))
+    def test_slow_probes_time_out(self, probe_broker_mock, probe_database_mock, probe_file_store_mock):
+        response = self.client.get(reverse('deep-health'))
+        self.assertEqual(response.json()['status'], 'degraded')
+        self.assertEqual(response.json()['checks']['broker'], {'status': 'error', 'error': 'timeout'})
+
+    @override_settings(HEALTH_CHECK_CACHE_SECONDS=60)
+    @patch('archive.health.probe_database', return_value={})
+    def test_result_is_cached(self, probe_database_mock, probe_file_store_mock):
+        with patch('archive.health._last_check', None):
+            for _ in range(3):
+                self.assertEqual(self.client.get(reverse('deep-health')).status_code, 200)
+        self.assertEqual(probe_file_store_mock.call_count, 1)
+
+    @override_settings(HEALTH_CHECK_TIMEOUT_SECONDS=0.1)
+    @patch('archive.health.probe_database', return_value={})
+    def test_stuck_probe_is_not_started_again(self, probe_database_mock, probe_file_store_mock):
+        release = threading.Event()
+        probe_file_store_mock.side_effect = lambda: release.wait(5)
+        for _ in range(3):
+            self.assertEqual(self.client.get(reverse('deep-health')).status_code, 503)
+        release.set()
+        self.assertEqual(probe_file_store_mock.call_count, 1)
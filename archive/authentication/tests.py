@@ -1,15 +1,19 @@
 from django.contrib.auth.models import User
 from django.conf import settings
 from unittest.mock import patch
-from archive.authentication.models import Profile
+from archive.authentication.models import Profile, proposals_cache_key
 from archive.frames.tests.factories import FrameFactory
 from archive.test_helpers import ReplicationTestCase
+from archive.http_client import CircuitBreaker
 from archive.frames.utils import aggregate_frames_sql, set_cached_frames_aggregates
 from archive.frames.models import Frame
 from rest_framework.test import APITestCase
 from ocs_authentication.auth_profile.models import AuthProfile
 from django.urls import reverse
+from django.core.cache import cache
+import requests
 import responses
+import time
 import json
 
 
@@ -89,3 +93,84 @@ class TestAuthentication(ReplicationTestCase):
 
         self.assertCountEqual(['prop1', 'prop2'], self.admin_user.profile.proposals)
         self.assertFalse(get_mock.called)
+
+
+class InlineExecutor:
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, fn, *args):
+        self.submitted.append(args)
+        fn(*args)
+
+
+class TestProposalsCache(ReplicationTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='samwise')
+        Profile.objects.get_or_create(user=self.user)
+        AuthProfile.objects.create(user=self.user, api_token='samwise_token')
+        # Keep the failures in these tests from suspending calls to the oauth server for other tests
+        circuit_breaker_patcher = patch('archive.http_client.get_circuit_breaker', return_value=CircuitBreaker(100, 30))
+        circuit_breaker_patcher.start()
+        self.addCleanup(circuit_breaker_patcher.stop)
+
+    def set_stale_entry(self, proposals):
+        cache.set(proposals_cache_key(self.user.id), {'proposals': proposals, 'fresh_until': time.time() - 1}, 600)
+
+    @responses.activate
+    def test_fresh_proposals_do_not_call_oauth_server(self):
+        cache.set(proposals_cache_key(self.user.id), {'proposals': ['prop1'], 'fresh_until': time.time() + 600}, 600)
+        self.assertEqual(['prop1'], self.user.profile.proposals)
+        self.assertEqual(len(responses.calls), 0)
+
+    @responses.activate
+    def test_stale_proposals_served_while_refreshing(self):
+        responses.add(
+            responses.GET,
+            settings.OCS_AUTHENTICATION['OAUTH_PROFILE_URL'],
+            json={'proposals': [{'id': 'prop2'}]},
+            status=200
+        )
+        self.set_stale_entry(['prop1'])
+        executor = InlineExecutor()
+        with patch('archive.authentication.models.get_refresh_executor', return_value=executor):
+            self.assertEqual(['prop1'], self.user.profile.proposals)
+            self.assertEqual(['prop2'], self.user.profile.proposals)
+        self.assertEqual(len(executor.submitted), 1)
+        self.assertEqual(responses.calls[0].request.headers['Authorization'], 'Token samwise_token')
+
+    def test_only_one_refresh_per_user(self):
+        self.set_stale_entry(['prop1'])
+        executor = InlineExecutor()
+        with patch('archive.authentication.models.get_refresh_executor', return_value=executor):
+            with patch('archive.authentication.models.refresh_proposals'):
+                for _ in range(3):
+                    self.assertEqual(['prop1'], self.user.profile.proposals)
+        self.assertEqual(len(executor.submitted), 1)
+
+    @responses.activate
+    def test_failed_refresh_keeps_stale_proposals(self):
+        responses.add(
+            responses.GET,
+            settings.OCS_AUTHENTICATION['OAUTH_PROFILE_URL'],
+            body=requests.exceptions.ReadTimeout()
+        )
+        self.set_stale_entry(['prop1'])
+        with patch('archive.authentication.models.get_refresh_executor', return_value=InlineExecutor()):
+            self.assertEqual(['prop1'], self.user.profile.proposals)
+        entry = cache.get(proposals_cache_key(self.user.id))
+        self.assertEqual(['prop1'], entry['proposals'])
+        self.assertLessEqual(entry['fresh_until'], time.time() + settings.PROPOSALS_CACHE_FAILURE_TIMEOUT)
+        self.assertFalse(cache.get(proposals_cache_key(self.user.id) + '_lock'))
+
+    @responses.activate
+    def test_failure_without_cached_proposals_is_retried_soon(self):
+        responses.add(
+            responses.GET,
+            settings.OCS_AUTHENTICATION['OAUTH_PROFILE_URL'],
+            status=503
+        )
+        with patch('archive.authentication.models.cache.set') as cache_set:
+            self.assertEqual([], self.user.profile.proposals)
+        self.assertEqual(cache_set.call_args[0][2], settings.PROPOSALS_CACHE_FAILURE_TIMEOUT)
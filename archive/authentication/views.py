@@ -9,6 +9,7 @@ from rest_framework import throttling, status
 from archive.authentication.serializers import UserSerializer, RevokeTokenResponseSerializer
 from archive.schema import ScienceArchiveSchema
 from archive.doc_examples import EXAMPLE_REQUESTS, EXAMPLE_RESPONSES
+from archive import health
 
 
 class UserView(RetrieveAPIView):
@@ -82,3 +83,26 @@ class HealthCheckView(APIView):
 
     def get_endpoint_name(self):
         return 'healthCheck'
+
+
+class DeepHealthCheckView(APIView):
+    """
+    Endpoint to check the health of the services the Science Archive depends on. Reports the status
+    and latency of the databases, including replication lag, the cache, the broker and the file store.
+    Returns a 503 if the archive can't serve requests without a failing service.
+    """
+    schema = ScienceArchiveSchema(tags=['Health'])
+    throttle_classes = (NoThrottle,)
+
+    def get(self, request, format=None):
+        overall_status, results = health.check_health()
+        return Response(
+            {'status': overall_status, 'checks': results},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE if overall_status == health.ERROR else status.HTTP_200_OK
+        )
+
+    def get_example_response(self):
+        return Response(EXAMPLE_RESPONSES['authentication']['deep_health'], status=status.HTTP_200_OK)
+
+    def get_endpoint_name(self):
+        return 'deepHealthCheck'
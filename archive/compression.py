@@ -0,0 +1,125 @@
+"""
+Content negotiation and incremental compressors for response compression.
+
+zstd and brotli are only offered when the optional zstandard and brotli packages are installed.
+gzip is always available.
+"""
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class GzipCompressor:
+    def __init__(self):
+        self.compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        return self.compressor.compress(data)
+
+    def flush(self):
+        return self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self.compressor.flush(zlib.Z_FINISH)
+
+
+class BrotliCompressor:
+    def __init__(self):
+        self.compressor = brotli.Compressor(quality=5)
+
+    def compress(self, data):
+        return self.compressor.process(data)
+
+    def flush(self):
+        return self.compressor.flush()
+
+    def finish(self):
+        return self.compressor.finish()
+
+
+class ZstdCompressor:
+    def __init__(self):
+        self.compressor = zstandard.ZstdCompressor(level=3).compressobj()
+
+    def compress(self, data):
+        return self.compressor.compress(data)
+
+    def flush(self):
+        return self.compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        return self.compressor.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+
+
+def get_compressors():
+    """
+    Returns the available compressors by content coding, in the order they are preferred
+    """
+    compressors = {}
+    if zstandard is not None:
+        compressors['zstd'] = ZstdCompressor
+    if brotli is not None:
+        compressors['br'] = BrotliCompressor
+    compressors['gzip'] = GzipCompressor
+    return compressors
+
+
+def parse_accept_encoding(header):
+    """
+    Returns the quality of each content coding in an Accept-Encoding header
+    """
+    qualities = {}
+    for part in header.split(','):
+        coding, _, params = part.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding] = quality
+    return qualities
+
+
+def choose_encoding(header, encodings):
+    """
+    Pick the content coding the client prefers out of the given ones, which are in the server's order
+    of preference. Returns None if the client accepts none of them.
+    """
+    qualities = parse_accept_encoding(header)
+    best_encoding, best_quality = None, 0.0
+    for encoding in encodings:
+        quality = qualities.get(encoding, qualities.get('*', 0.0))
+        if quality > best_quality:
+            best_encoding, best_quality = encoding, quality
+    return best_encoding
+
+
+def compress(data, encoding):
+    compressor = get_compressors()[encoding]()
+    return compressor.compress(data) + compressor.finish()
+
+
+def compress_sequence(sequence, encoding):
+    """
+    Compress an iterable of chunks, flushing after every chunk so that each one is sent as soon as it is ready
+    """
+    compressor = get_compressors()[encoding]()
+    for chunk in sequence:
+        data = compressor.compress(chunk) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
@@ -1,5 +1,8 @@
 from datetime import timedelta, datetime, timezone
 
+from django.conf import settings
+
+from archive import replication
 from archive.frames.models import Frame, Version
 
 
@@ -9,27 +12,40 @@ class DBClusterRouter:
     """
     def db_for_read(self, model, **hints):
         """
-        Reads for the archive frames models go to the reader endpoint.
+        Reads for the archive frames models go to one of the healthy reader endpoints,
+        or to the writer endpoint if none of them are healthy.
 
         Reads for certain frames models are directed to the writer endpoint if the
-        instance was recently created in order to prevent a race condition. This
-        could happen if, for example, data that has been committed has not been
-        replicated fast enough. This is an issue specifically in the frame
-        creation view.
+        instance was created more recently than the chosen replica's current lag (plus
+        a safety margin) in order to prevent a race condition. This could happen if,
+        for example, data that has been committed has not been replicated fast
+        enough. This is an issue specifically in the frame creation view.
+
+        Reads are also directed to the writer endpoint while handling a request
+        that carries a read-your-writes token the replica hasn't caught up to.
         """
-        new_instance_delay_minutes = 10
+        if 'archive.frames.models' not in str(model):
+            return 'default'
+
+        # The same replica is used for every read of a request, see PinReplicaMiddleware
+        replica = replication.get_replica()
+        if replica is None:
+            return 'default'
+
         new_instance_delay_models = (Frame, Version,)
         instance = hints.get('instance')
         created = getattr(instance, 'created', None)
 
         if isinstance(instance, new_instance_delay_models) and created is not None:
-            if created > datetime.now(timezone.utc) - timedelta(minutes=new_instance_delay_minutes):
+            lag = replication.get_replica_lag(replica)
+            if lag is None:
+                return 'default'
+            if created > datetime.now(timezone.utc) - timedelta(seconds=lag + settings.REPLICA_LAG_SAFETY_SECONDS):
                 return 'default'
 
-        if 'archive.frames.models' in str(model):
-            return 'replica'
-
-        return 'default'
+        if not replication.replica_is_caught_up(replica):
+            return 'default'
+        return replica
 
     def db_for_write(self, model, **hints):
         """
@@ -42,7 +58,7 @@ class DBClusterRouter:
         Allow relations between objects for both databases since
         they are replica and writer endpoints pointing at the same data.
         """
-        db_list = ('default', 'replica')
+        db_list = ('default', *settings.REPLICA_DATABASES)
         if obj1._state.db in db_list and obj2._state.db in db_list:
             return True
         return None
@@ -151,7 +151,17 @@ EXAMPLE_RESPONSES = {
         'funpack': '<uncompressed file contents>'
     },
     'authentication': {
-        'health': 'ok'
+        'health': 'ok',
+        'deep_health': {
+            'status': 'ok',
+            'checks': {
+                'database_default': {'status': 'ok', 'latency_ms': 1.2},
+                'database_replica': {'status': 'ok', 'lag_seconds': 0.0, 'latency_ms': 1.5},
+                'cache': {'status': 'ok', 'latency_ms': 0.4},
+                'broker': {'status': 'ok', 'latency_ms': 3.1},
+                'file_store': {'status': 'ok', 'latency_ms': 25.7},
+            }
+        }
     }
 }
 
@@ -166,6 +176,10 @@ QUERY_PARAMETERS = {
                       {'in': 'query', 'name': 'instrument_id', 'required': False, 'schema': {'type': 'string'}, 'description': 'Aggregate all fields for a given instrument'},
                       {'in': 'query', 'name': 'configuration_type', 'required': False, 'schema': {'type': 'string'}, 'description': 'Aggregate all fields for a given observation type'},
                       {'in': 'query', 'name': 'proposal_id', 'required': False, 'schema': {'type': 'string'}, 'description': 'Aggregate all fields for a given proposal ID'},
-                     ]
+                     ],
+        'export': [{'in': 'query', 'name': 'export_format', 'required': False, 'schema': {'type': 'string', 'enum': ['ndjson', 'csv', 'arrow', 'parquet'], 'default': 'ndjson'}, 'description': 'Format to export the frames in. arrow is an Arrow IPC stream. arrow and parquet have typed columns, with the area as WKB.'},
+                   {'in': 'query', 'name': 'columns', 'required': False, 'schema': {'type': 'string'}, 'description': 'Comma separated list of columns to export. Defaults to all columns.'},
+                   {'in': 'query', 'name': 'include_urls', 'required': False, 'schema': {'type': 'boolean', 'default': False}, 'description': 'Include a signed download URL for the latest version of each frame. Only available for ndjson and csv.'},
+                  ]
     }
 }
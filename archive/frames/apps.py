@@ -7,4 +7,5 @@ class FramesConfig(AppConfig):
 
     def ready(self):
         import archive.frames.signals.handlers  # noqa
+        import archive.frames.lookups  # noqa
         super().ready()
@@ -0,0 +1,95 @@
+"""
+Validators for conditional GETs of frames, so that clients polling for new data get a 304 Not Modified,
+without the frames being serialized or their URLs signed, when nothing has changed.
+
+A frame's validator is the later of its modified time and the creation time of its newest version. The
+modified time is also bumped when thumbnails or related frames are added to the frame. The validator of a
+list of frames is the newest of those over the whole filtered set, along with the number of frames in it,
+which changes when frames are deleted or become public.
+
+Responses that contain signed download URLs also change when the URLs are signed again, so their
+validators are never older than the start of the current URL signing window. That way a client that
+revalidates a cached response is never left with URLs that expire in less than half of their lifetime.
+"""
+from hashlib import blake2b
+import datetime
+import logging
+
+from django.db import connections, transaction, OperationalError, InternalError
+from django.db.models import Count, Max
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+
+from archive.frames.utils import FILE_URL_EXPIRATION_SECONDS
+
+logger = logging.getLogger()
+
+URL_WINDOW_SECONDS = FILE_URL_EXPIRATION_SECONDS // 2
+
+
+def url_window_start(now=None):
+    """
+    Returns the start of the current URL signing window
+    """
+    now = now or timezone.now()
+    timestamp = int(now.timestamp())
+    return datetime.datetime.fromtimestamp(timestamp - timestamp % URL_WINDOW_SECONDS, tz=datetime.timezone.utc)
+
+
+def frame_last_modified(frame):
+    """
+    Returns when the frame or its versions last changed. The versions should be prefetched.
+    """
+    versions = frame.version_set.all()
+    # Versions are ordered newest first
+    if versions:
+        return max(frame.modified, versions[0].created)
+    return frame.modified
+
+
+def frames_last_modified(frames, timeout=1500):
+    """
+    Returns when any of the frames or their versions last changed, and how many frames there are. Returns
+    None if the query takes longer than the timeout in milliseconds.
+    """
+    using = frames.db
+    # Aggregate over the primary keys only, so that none of the annotations of the queryset are computed
+    frame_ids = frames.order_by().values('pk')
+    try:
+        with transaction.atomic(using=using), connections[using].cursor() as cursor:
+            cursor.execute(f'SET LOCAL statement_timeout TO {int(timeout)};')
+            result = frames.model.objects.using(using).filter(pk__in=frame_ids).aggregate(
+                modified=Max('modified'), version_created=Max('version__created'), count=Count('id', distinct=True)
+            )
+    except (OperationalError, InternalError):
+        logger.warning(f'Getting the frame validators timed out after {timeout} milliseconds')
+        return None
+    last_modified = max(
+        (value for value in (result['modified'], result['version_created']) if value is not None), default=None
+    )
+    return last_modified, result['count']
+
+
+def make_etag(*parts):
+    return quote_etag(blake2b(repr(parts).encode('utf-8'), digest_size=16).hexdigest())
+
+
+def set_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    return response
+
+
+def conditional_response(request, etag, last_modified):
+    """
+    Returns a 304 Not Modified response if the client's copy is still current, or None if the response
+    should be built as usual
+    """
+    response = get_conditional_response(
+        request, etag=etag, last_modified=int(last_modified.timestamp()) if last_modified is not None else None
+    )
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
@@ -0,0 +1,226 @@
+"""
+Streaming export of frame metadata.
+
+Frames are read from the database in chunks with a server side cursor, and each chunk is written
+out before the next one is read, so memory use doesn't grow with the number of frames exported.
+Only the latest version of each frame is exported, and its signed download URL is only included
+when asked for, since signing is the most expensive part of serializing a frame.
+
+NDJSON and CSV exports are built from model instances. Arrow IPC stream and Parquet exports are
+built column-wise straight from value rows, with typed columns and the area as WKB, so they can be
+loaded into a DataFrame without any parsing. They need the optional pyarrow package.
+"""
+from django.contrib.gis.db.models.functions import AsWKB
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import CharField, OuterRef, Subquery
+from django.db.models.functions import Concat
+
+import datetime
+import json
+import csv
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+from archive.frames.models import Version
+from archive.frames.utils import get_file_store, polygon_geojson
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+    'arrow': 'application/vnd.apache.arrow.stream',
+    'parquet': 'application/vnd.apache.parquet',
+}
+ARROW_FORMATS = ('arrow', 'parquet')
+EXPORT_COLUMNS = (
+    'id', 'basename', 'filename', 'observation_date', 'observation_day', 'proposal_id', 'instrument_id',
+    'target_name', 'reduction_level', 'site_id', 'telescope_id', 'exposure_time', 'primary_optical_element',
+    'public_date', 'configuration_type', 'observation_id', 'request_id', 'area',
+)
+# Columns that need the frame's versions to be fetched
+VERSION_COLUMNS = ('filename', 'url')
+
+
+def arrow_formats_available():
+    return pyarrow is not None
+
+
+def get_arrow_types():
+    return {
+        'id': pyarrow.int64(),
+        'basename': pyarrow.string(),
+        'filename': pyarrow.string(),
+        'observation_date': pyarrow.timestamp('us', tz='UTC'),
+        'observation_day': pyarrow.date32(),
+        'proposal_id': pyarrow.string(),
+        'instrument_id': pyarrow.string(),
+        'target_name': pyarrow.string(),
+        'reduction_level': pyarrow.int16(),
+        'site_id': pyarrow.string(),
+        'telescope_id': pyarrow.string(),
+        'exposure_time': pyarrow.float64(),
+        'primary_optical_element': pyarrow.string(),
+        'public_date': pyarrow.timestamp('us', tz='UTC'),
+        'configuration_type': pyarrow.string(),
+        'observation_id': pyarrow.int64(),
+        'request_id': pyarrow.int64(),
+        'area': pyarrow.binary(),
+    }
+
+
+class EchoBuffer:
+    """
+    A file-like object for csv.writer that returns what is written to it instead of storing it
+    """
+    def write(self, value):
+        return value
+
+
+class ChunkSink:
+    """
+    A file-like object for pyarrow writers that collects what is written to it until it is drained,
+    while keeping track of the total position so the writers can record offsets into the file
+    """
+    closed = False
+
+    def __init__(self):
+        self.buffer = []
+        self.position = 0
+
+    def write(self, data):
+        self.buffer.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self.buffer)
+        self.buffer = []
+        return data
+
+
+def batched(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class FrameExporter:
+    def __init__(self, frames, columns, include_urls=False, chunk_size=2000):
+        self.columns = list(columns) + (['url'] if include_urls else [])
+        self.frames = frames
+        self.chunk_size = chunk_size
+        self.file_store = get_file_store() if include_urls else None
+
+    def get_value(self, frame, column):
+        if column in VERSION_COLUMNS:
+            versions = frame.version_set.all()
+            if not versions:
+                return None
+            # Versions are ordered newest first, so the first one is the latest
+            if column == 'url':
+                return versions[0].get_url(self.file_store)
+            return '{0}{1}'.format(frame.basename, versions[0].extension)
+        if column == 'area':
+            return polygon_geojson(frame.area) if frame.area else None
+        return getattr(frame, column)
+
+    def chunks(self):
+        """
+        Yields lists of rows, each a list of values in column order
+        """
+        frames = self.frames
+        if any(column in VERSION_COLUMNS for column in self.columns):
+            frames = frames.prefetch_related('version_set')
+        frames = frames.iterator(chunk_size=self.chunk_size)
+        for chunk in batched(frames, self.chunk_size):
+            yield [[self.get_value(frame, column) for column in self.columns] for frame in chunk]
+
+    def value_chunks(self):
+        """
+        Yields lists of value rows in column order, computing the filename and area WKB in the database
+        """
+        annotations = {}
+        fields = []
+        for column in self.columns:
+            if column == 'filename':
+                latest_extension = Version.objects.filter(frame=OuterRef('pk')).order_by('-created').values('extension')[:1]
+                annotations['export_filename'] = Concat('basename', Subquery(latest_extension), output_field=CharField())
+                fields.append('export_filename')
+            elif column == 'area':
+                annotations['export_area'] = AsWKB('area')
+                fields.append('export_area')
+            else:
+                fields.append(column)
+        rows = self.frames.annotate(**annotations).values_list(*fields).iterator(chunk_size=self.chunk_size)
+        return batched(rows, self.chunk_size)
+
+    def get_schema(self):
+        arrow_types = get_arrow_types()
+        return pyarrow.schema([(column, arrow_types[column]) for column in self.columns])
+
+    def record_batches(self, schema):
+        area_index = self.columns.index('area') if 'area' in self.columns else None
+        for chunk in self.value_chunks():
+            columns = [list(values) for values in zip(*chunk)]
+            if area_index is not None:
+                columns[area_index] = [bytes(wkb) if wkb is not None else None for wkb in columns[area_index]]
+            arrays = [pyarrow.array(values, type=field.type) for values, field in zip(columns, schema)]
+            yield pyarrow.RecordBatch.from_arrays(arrays, schema=schema)
+
+    def ndjson(self):
+        encoder = DjangoJSONEncoder()
+        for chunk in self.chunks():
+            yield ''.join(encoder.encode(dict(zip(self.columns, row))) + '\n' for row in chunk)
+
+    def csv(self):
+        writer = csv.writer(EchoBuffer())
+        yield writer.writerow(self.columns)
+        for chunk in self.chunks():
+            yield ''.join(writer.writerow([self.csv_value(value) for value in row]) for row in chunk)
+
+    def arrow(self):
+        schema = self.get_schema()
+        sink = ChunkSink()
+        with pyarrow.ipc.new_stream(sink, schema) as writer:
+            for batch in self.record_batches(schema):
+                writer.write_batch(batch)
+                yield sink.drain()
+        yield sink.drain()
+
+    def parquet(self):
+        schema = self.get_schema()
+        sink = ChunkSink()
+        # Each chunk becomes a row group, so it can be written out as soon as it has been read
+        with pyarrow.parquet.ParquetWriter(sink, schema) as writer:
+            for batch in self.record_batches(schema):
+                writer.write_batch(batch)
+                yield sink.drain()
+        yield sink.drain()
+
+    @staticmethod
+    def csv_value(value):
+        if isinstance(value, (datetime.date, datetime.datetime)):
+            return value.isoformat()
+        if isinstance(value, dict):
+            return json.dumps(value)
+        return value
+
+    def stream(self, export_format):
+        return getattr(self, export_format)()
@@ -77,7 +77,7 @@ class FrameFilter(django_filters.FilterSet):
             if self.request.user.is_authenticated and not self.request.user.is_superuser:
                 user_proposals = self.request.user.profile.proposals
                 if user_proposals:
-                    return queryset.filter(proposal_id__in=user_proposals)
+                    return queryset.filter(proposal_id__any=user_proposals)
             else:
                 return queryset.exclude(public_date__lt=datetime.datetime.now(datetime.timezone.utc))
         return queryset
@@ -120,13 +120,25 @@ class FrameFilter(django_filters.FilterSet):
                   'observation_id', 'request_id']
 
 
+class CharInFilter(django_filters.BaseInFilter, django_filters.CharFilter):
+    pass
+
+
+class NumberInFilter(django_filters.BaseInFilter, django_filters.NumberFilter):
+    pass
+
+
 class ThumbnailFilter(django_filters.FilterSet):
     frame_basename = django_filters.CharFilter(field_name='frame__basename', lookup_expr='exact')
+    frame_basenames = CharInFilter(field_name='frame__basename', lookup_expr='in')
     proposal_id = django_filters.CharFilter(field_name='frame__proposal_id', lookup_expr='exact')
     observation_id = django_filters.NumberFilter(field_name='frame__observation_id', lookup_expr='exact')
+    observation_ids = NumberInFilter(field_name='frame__observation_id', lookup_expr='in')
     request_id = django_filters.NumberFilter(field_name='frame__request_id', lookup_expr='exact')
+    request_ids = NumberInFilter(field_name='frame__request_id', lookup_expr='in')
     size = django_filters.ChoiceFilter(choices=[(size,size) for size in settings.THUMBNAIL_SIZE_CHOICES], field_name='size', lookup_expr='exact')
 
     class Meta:
         model = Thumbnail
-        fields = ['frame_basename', 'proposal_id', 'observation_id', 'request_id', 'size']
+        fields = ['frame_basename', 'frame_basenames', 'proposal_id', 'observation_id', 'observation_ids',
+                  'request_id', 'request_ids', 'size']
@@ -0,0 +1,20 @@
+from django.db.models import CharField, Lookup
+
+
+@CharField.register_lookup
+class AnyLookup(Lookup):
+    """
+    field__any=[...] matches rows where the field equals any value in the list. Unlike __in,
+    the list is passed as a single array parameter, so the SQL stays the same no matter how
+    many values there are.
+    """
+    lookup_name = 'any'
+    prepare_rhs = False
+
+    def get_prep_lookup(self):
+        return [str(value) for value in self.rhs]
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} = ANY({rhs}::text[])', (*lhs_params, *rhs_params)
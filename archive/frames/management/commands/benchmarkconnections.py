@@ -0,0 +1,70 @@
+from django.core import signals
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+import statistics
+import time
+import json
+
+
+class Command(BaseCommand):
+    help = ("Measure how much of a request's database latency is spent setting up the connection, by timing "
+            "a trivial query on a new connection, on a reused connection, and with the configured connection settings")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', type=str, default='default',
+                            help='Database alias to benchmark')
+        parser.add_argument('--iterations', type=int, default=200,
+                            help='Number of queries to time for each mode')
+
+    def time_query(self, connection):
+        start = time.perf_counter()
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
+        return (time.perf_counter() - start) * 1000
+
+    def summarize(self, timings):
+        return {
+            'median_ms': round(statistics.median(timings), 3),
+            'p95_ms': round(statistics.quantiles(timings, n=20)[-1], 3),
+        }
+
+    def handle(self, *args, **options):
+        alias = options['database']
+        iterations = options['iterations']
+        if alias not in connections:
+            raise CommandError(f'Unknown database alias {alias}')
+        if iterations < 2:
+            raise CommandError('At least 2 iterations are needed')
+        connection = connections[alias]
+
+        new_connection = []
+        for _ in range(iterations):
+            connection.close()
+            new_connection.append(self.time_query(connection))
+
+        connection.ensure_connection()
+        reused_connection = [self.time_query(connection) for _ in range(iterations)]
+
+        # Go through the same request signals as a view, so CONN_MAX_AGE and CONN_HEALTH_CHECKS apply
+        configured = []
+        connection.close()
+        for _ in range(iterations):
+            signals.request_started.send(sender=self.__class__)
+            configured.append(self.time_query(connection))
+            signals.request_finished.send(sender=self.__class__)
+
+        results = {
+            'database': alias,
+            'iterations': iterations,
+            'conn_max_age': connection.settings_dict['CONN_MAX_AGE'],
+            'conn_health_checks': connection.settings_dict['CONN_HEALTH_CHECKS'],
+            'new_connection': self.summarize(new_connection),
+            'reused_connection': self.summarize(reused_connection),
+            'configured': self.summarize(configured),
+        }
+        results['connection_setup_ms'] = round(
+            results['new_connection']['median_ms'] - results['reused_connection']['median_ms'], 3
+        )
+        self.stdout.write(json.dumps(results, indent=2))
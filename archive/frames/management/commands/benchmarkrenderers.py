@@ -0,0 +1,48 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from archive.frames.models import Frame, frames_as_dicts
+from archive.renderers import FastJSONRenderer, orjson
+
+import statistics
+import time
+import json
+
+
+class Command(BaseCommand):
+    help = "Compare the time taken to render a maximum size page of frames with DRF's JSONRenderer and the FastJSONRenderer"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=settings.PAGINATION_MAX_LIMIT,
+                            help='Number of frames in the page')
+        parser.add_argument('--iterations', type=int, default=20,
+                            help='Number of times to render the page with each renderer')
+
+    def time_render(self, renderer, data, iterations):
+        timings = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            renderer.render(data)
+            timings.append((time.perf_counter() - start) * 1000)
+        return round(statistics.median(timings), 3)
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            raise CommandError('orjson is not installed, so the FastJSONRenderer falls back to JSONRenderer')
+        frames = Frame.objects.exclude(observation_date=None).prefetch_related('version_set', 'related_frames')
+        page = frames_as_dicts(frames[:options['page_size']], include_related_frames=True)
+        data = {'count': len(page), 'next': None, 'previous': None, 'results': page, 'count_estimated': False}
+
+        json_renderer, fast_renderer = JSONRenderer(), FastJSONRenderer()
+        if json_renderer.render(data) != fast_renderer.render(data):
+            raise CommandError('The renderers produced different output')
+        json_ms = self.time_render(json_renderer, data, options['iterations'])
+        fast_ms = self.time_render(fast_renderer, data, options['iterations'])
+        self.stdout.write(json.dumps({
+            'frames': len(page),
+            'bytes': len(fast_renderer.render(data)),
+            'json_renderer_median_ms': json_ms,
+            'fast_json_renderer_median_ms': fast_ms,
+            'speedup': round(json_ms / fast_ms, 1) if fast_ms else None,
+        }, indent=2))
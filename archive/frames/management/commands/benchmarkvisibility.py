@@ -0,0 +1,74 @@
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from archive.frames.models import Frame
+from archive.frames.utils import frame_visibility_filter
+
+import datetime
+import statistics
+import time
+import json
+
+
+class Command(BaseCommand):
+    help = ("Compare the time taken to list the frames a user can see with the proposal_id IN (...) filter and the "
+            "proposal_id = ANY(...) filter, for users with 1, 50 and 500 proposals")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--proposal-counts', type=int, nargs='+', default=[1, 50, 500],
+                            help='Numbers of proposals to give the user')
+        parser.add_argument('--page-size', type=int, default=settings.PAGINATION_DEFAULT_LIMIT,
+                            help='Number of frames in the page')
+        parser.add_argument('--iterations', type=int, default=20,
+                            help='Number of times to run the query with each filter')
+        parser.add_argument('--database', type=str, default='default',
+                            help='Database alias to benchmark')
+
+    def get_proposals(self, database, count):
+        """
+        Returns proposals that have frames, padded with proposals that don't exist, like those of a user
+        who belongs to many proposals without data
+        """
+        proposals = list(
+            Frame.objects.using(database).exclude(proposal_id='').order_by()
+            .values_list('proposal_id', flat=True).distinct()[:count]
+        )
+        proposals.extend('BENCHMARK-{}'.format(i) for i in range(count - len(proposals)))
+        return proposals
+
+    def in_filter(self, proposals):
+        # The filter used before the ANY lookup was added
+        public = Q(public_date__lt=datetime.datetime.now(datetime.timezone.utc))
+        return public | Q(proposal_id__in=proposals)
+
+    def time_query(self, database, visibility, page_size, iterations):
+        queryset = Frame.objects.using(database).exclude(observation_date=None).filter(visibility).order_by('-id')
+        timings = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            list(queryset.values_list('id', flat=True)[:page_size])
+            timings.append((time.perf_counter() - start) * 1000)
+        return round(statistics.median(timings), 3)
+
+    def handle(self, *args, **options):
+        database = options['database']
+        if options['iterations'] < 1:
+            raise CommandError('At least 1 iteration is needed')
+        results = []
+        for count in options['proposal_counts']:
+            proposals = self.get_proposals(database, count)
+            user = SimpleNamespace(is_superuser=False, is_authenticated=True, profile=SimpleNamespace(proposals=proposals))
+            in_ms = self.time_query(database, self.in_filter(proposals), options['page_size'], options['iterations'])
+            any_ms = self.time_query(
+                database, frame_visibility_filter(user), options['page_size'], options['iterations']
+            )
+            results.append({
+                'proposals': count,
+                'in_median_ms': in_ms,
+                'any_median_ms': any_ms,
+                'speedup': round(in_ms / any_ms, 1) if any_ms else None,
+            })
+        self.stdout.write(json.dumps(results, indent=2))
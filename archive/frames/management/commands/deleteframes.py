@@ -3,10 +3,17 @@ from datetime import timedelta, date, datetime, timezone
 from django.core.management.base import BaseCommand, CommandError
 
 from archive.frames.models import Frame
+from archive.frames.purge import FramePurger, CheckpointMismatch
 import logging
+import json
 logger = logging.getLogger()
 
-DELETE_BATCH = 1000
+DELETE_BATCH = 5000
+FILTER_OPTIONS = (
+    'days_old', 'start', 'end', 'reduction_level', 'request_id', 'observation_id', 'site', 'telescope',
+    'exclude_types', 'include_types', 'exclude_proposals', 'include_proposals', 'exclude_instruments',
+    'include_instruments',
+)
 
 
 class Command(BaseCommand):
@@ -41,6 +48,18 @@ class Command(BaseCommand):
                             help='Exclude these instrument codes from the query')
         parser.add_argument('--include-instruments', nargs='*', required=False,
                             help='Include these instrument codes in the query')
+        parser.add_argument('--batch-size', type=int, default=DELETE_BATCH,
+                            help='Number of frames to delete from the database at a time')
+        parser.add_argument('--workers', type=int, default=8,
+                            help='Number of threads deleting files from the file store in parallel')
+        parser.add_argument('--checkpoint-file', type=str, required=False,
+                            help='File to save progress to, so an interrupted run can be resumed by running the same command again')
+        parser.add_argument('--vacuum', action='store_true',
+                            help='Vacuum and analyze the frame tables once the frames have been deleted')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Print a JSON plan of how much would be deleted and a lower bound of how long it would take, without deleting anything')
+        parser.add_argument('--sample-size', type=int, default=100,
+                            help='Number of files to get the size of when estimating the bytes a dry run would delete')
 
     def handle(self, *args, **options):
         frames = Frame.objects.all().using('default')
@@ -80,8 +99,20 @@ class Command(BaseCommand):
 
         logger.warning(frames.query)
 
-        while frames.count() > 0:
-            pks_to_delete = frames.values_list('pk', flat=True)[:DELETE_BATCH]
-            delete_results = Frame.objects.filter(pk__in=pks_to_delete).delete()
-            for key, val in delete_results[1].items():
-                logger.info(f"Deleted {val} instances of {key}")
+        options_key = json.dumps({option: options[option] for option in FILTER_OPTIONS}, sort_keys=True, default=str)
+        purger = FramePurger(
+            frames, options_key, batch_size=options['batch_size'], workers=options['workers'],
+            checkpoint_file=options['checkpoint_file'], vacuum=options['vacuum']
+        )
+        if options['dry_run']:
+            self.stdout.write(json.dumps(purger.plan(sample_size=options['sample_size']), indent=2))
+            self.stderr.write(
+                'The estimated runtime is a lower bound, measured by finding the rows and file sizes of the first '
+                'batch without deleting them. Deleting them will take longer.'
+            )
+            return
+        try:
+            results = purger.run()
+        except CheckpointMismatch as e:
+            raise CommandError(str(e))
+        logger.info('Finished deleting frames', extra={'tags': results})
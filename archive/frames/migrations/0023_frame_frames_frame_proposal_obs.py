@@ -0,0 +1,19 @@
+# Generated by Django 6.0.5 on 2026-10-19 12:00
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('frames', '0022_remove_frame_frames_frame_aggregate_and_more'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='frame',
+            index=models.Index(fields=['proposal_id', 'observation_date'], name='frames_frame_proposal_obs'),
+        ),
+    ]
@@ -1,4 +1,5 @@
-from archive.frames.utils import get_file_store_path
+from archive.frames.utils import get_file_store_path, get_file_store, polygon_geojson, FILE_URL_EXPIRATION_SECONDS
+from django.contrib.gis.db.models.functions import AsGeoJSON
 from django.utils.functional import cached_property
 from django.db.models import JSONField, Index
 import logging
@@ -6,7 +7,6 @@ import json
 from django.contrib.gis.db import models
 from django.forms.models import model_to_dict
 
-from ocs_archive.storage.filestorefactory import FileStoreFactory
 from ocs_archive.settings import settings as archive_settings
 
 logger = logging.getLogger()
@@ -97,6 +97,8 @@ class Frame(models.Model):
     class Meta:
         indexes = [
             Index(fields=["observation_date", "public_date", "site_id", "telescope_id", "instrument_id", "configuration_type", "primary_optical_element", "proposal_id"], name='frames_frame_aggregate'),
+            # Lets the private branch of the frame visibility filter use an index, see frame_visibility_filter
+            Index(fields=["proposal_id", "observation_date"], name='frames_frame_proposal_obs'),
         ]
         ordering = ['-observation_date']
 
@@ -135,38 +137,99 @@ class Frame(models.Model):
             archive_settings.PUBLIC_DATE_KEY: self.public_date,
         }
 
-    def as_dict(self, include_thumbnails=False, include_related_frames=False):
-        ret_dict = model_to_dict(self, exclude=('related_frames', 'area'))
-        ret_dict['version_set'] = [v.as_dict() for v in self.version_set.all()]
-        ret_dict['url'] = self.url if self.version_set.exists() else None
-        ret_dict['filename'] = self.filename if self.version_set.exists() else None
-        if include_thumbnails:
-            ret_dict['thumbnails'] = [t.as_dict() for t in Thumbnail.objects.filter(frame=self)]
+    def as_dict(self, include_thumbnails=False, include_related_frames=False, file_store=None, fields=None):
+        """
+        Versions, thumbnails and related frames are read from the prefetched relations if there are any.
+        Pass a file store to reuse it for signing the URLs of many frames. Pass a set of fields to only
+        serialize those, which skips signing URLs and converting the area when they aren't wanted.
+        """
+        def wanted(field):
+            return fields is None or field in fields
+
+        ret_dict = model_to_dict(self, fields=[field for field in FRAME_MODEL_FIELDS if wanted(field)])
+        if any(wanted(field) for field in FRAME_VERSION_FIELDS):
+            versions = list(self.version_set.all())
+            if wanted('version_set') or wanted('url'):
+                file_store = file_store or get_file_store()
+            if wanted('version_set'):
+                ret_dict['version_set'] = [v.as_dict(file_store) for v in versions]
+            if wanted('url'):
+                # Versions are ordered newest first, so the first one is the latest
+                if wanted('version_set'):
+                    ret_dict['url'] = ret_dict['version_set'][0]['url'] if versions else None
+                else:
+                    ret_dict['url'] = versions[0].get_url(file_store) if versions else None
+            if wanted('filename'):
+                ret_dict['filename'] = '{0}{1}'.format(self.basename, versions[0].extension) if versions else None
         # TODO: Remove these old model field names once users have migrated their code
-        ret_dict['DATE_OBS'] = ret_dict['observation_date']
-        ret_dict['DAY_OBS'] = ret_dict['observation_day']
-        ret_dict['PROPID'] = ret_dict['proposal_id']
-        ret_dict['INSTRUME'] = ret_dict['instrument_id']
-        ret_dict['OBJECT'] = ret_dict['target_name']
-        ret_dict['RLEVEL'] = ret_dict['reduction_level']
-        ret_dict['SITEID'] = ret_dict['site_id']
-        ret_dict['TELID'] = ret_dict['telescope_id']
-        ret_dict['EXPTIME'] = ret_dict['exposure_time']
-        ret_dict['FILTER'] = ret_dict['primary_optical_element']
-        ret_dict['L1PUBDAT'] = ret_dict['public_date']
-        ret_dict['OBSTYPE'] = ret_dict['configuration_type']
-        ret_dict['BLKUID'] = ret_dict['observation_id']
-        ret_dict['REQNUM'] = ret_dict['request_id']
-
-        if self.area:
-            ret_dict['area'] = json.loads(self.area.geojson)
-        if include_thumbnails:
-            ret_dict['thumbnails'] = [t.as_dict() for t in Thumbnail.objects.filter(frame=self)]
-        if include_related_frames:
-            ret_dict['related_frames'] = list(self.related_frames.all().values_list('id', flat=True))
+        for legacy_field, field in FRAME_LEGACY_FIELDS.items():
+            if wanted(legacy_field):
+                ret_dict[legacy_field] = getattr(self, field)
+
+        if wanted('area'):
+            # The area is selected as GeoJSON by querysets from with_area_geojson
+            if hasattr(self, 'area_geojson'):
+                if self.area_geojson:
+                    ret_dict['area'] = json.loads(self.area_geojson)
+            elif self.area:
+                ret_dict['area'] = polygon_geojson(self.area)
+        if include_thumbnails and wanted('thumbnails'):
+            file_store = file_store or get_file_store()
+            ret_dict['thumbnails'] = [t.as_dict(file_store) for t in self.thumbnails.all()]
+        if include_related_frames and wanted('related_frames'):
+            ret_dict['related_frames'] = [related_frame.id for related_frame in self.related_frames.all()]
         return ret_dict
 
 
+# The fields of Frame.as_dict, which can be chosen with the fields and omit query parameters
+FRAME_MODEL_FIELDS = tuple(
+    field.name for field in Frame._meta.concrete_fields if field.editable and field.name != 'area'
+)
+FRAME_VERSION_FIELDS = ('version_set', 'url', 'filename')
+FRAME_LEGACY_FIELDS = {
+    'DATE_OBS': 'observation_date',
+    'DAY_OBS': 'observation_day',
+    'PROPID': 'proposal_id',
+    'INSTRUME': 'instrument_id',
+    'OBJECT': 'target_name',
+    'RLEVEL': 'reduction_level',
+    'SITEID': 'site_id',
+    'TELID': 'telescope_id',
+    'EXPTIME': 'exposure_time',
+    'FILTER': 'primary_optical_element',
+    'L1PUBDAT': 'public_date',
+    'OBSTYPE': 'configuration_type',
+    'BLKUID': 'observation_id',
+    'REQNUM': 'request_id',
+}
+FRAME_FIELDS = (
+    FRAME_MODEL_FIELDS + FRAME_VERSION_FIELDS + tuple(FRAME_LEGACY_FIELDS) + ('area', 'thumbnails', 'related_frames')
+)
+# Fields of the frame used to build the file store paths of its versions and thumbnails
+FRAME_PATH_FIELDS = (
+    'basename', 'observation_date', 'observation_day', 'reduction_level', 'instrument_id', 'exposure_time',
+    'site_id', 'telescope_id', 'observation_id', 'primary_optical_element', 'target_name', 'request_id',
+    'configuration_type', 'proposal_id', 'public_date',
+)
+
+
+def frame_only_fields(fields):
+    """
+    Returns the database columns needed to serialize the given fields of frames, for QuerySet.only()
+    """
+    only_fields = {
+        FRAME_LEGACY_FIELDS.get(field, field) for field in fields
+        if field in FRAME_MODEL_FIELDS or field in FRAME_LEGACY_FIELDS
+    }
+    if 'filename' in fields:
+        only_fields.add('basename')
+    if fields & {'version_set', 'url', 'thumbnails'}:
+        only_fields.update(FRAME_PATH_FIELDS)
+    # Needed for the conditional GET validators
+    only_fields.add('modified')
+    return only_fields
+
+
 class Thumbnail(models.Model):
     frame = models.ForeignKey(
         Frame,
@@ -194,11 +257,16 @@ class Thumbnail(models.Model):
         default=''
     )
 
-    def as_dict(self):
-        ret_dict = model_to_dict(self)
-        ret_dict['url'] = self.url
-        ret_dict['size'] = self.size
-        return ret_dict
+    def as_dict(self, file_store=None):
+        return {
+            'id': self.id,
+            'frame': self.frame_id,
+            'size': self.size,
+            'basename': self.basename,
+            'extension': self.extension,
+            'key': self.key,
+            'url': self.get_url(file_store),
+        }
 
     @property
     def filename(self):
@@ -208,20 +276,58 @@ class Thumbnail(models.Model):
         return '{0}{1}'.format(self.basename, self.extension)
 
     @cached_property
-    def url(self):
-        path = get_file_store_path(self.filename, {'SITEID': self.frame.site_id, 'INSTRUME': self.frame.instrument_id, 'TELID': self.frame.telescope_id,
+    def path(self):
+        return get_file_store_path(self.filename, {'SITEID': self.frame.site_id, 'INSTRUME': self.frame.instrument_id, 'TELID': self.frame.telescope_id,
                                                    'DAY-OBS': self.frame.observation_day.strftime('%Y%m%d'), 'DATE-OBS': self.frame.observation_date.isoformat(),
                                                    'frame_basename': self.frame.basename, 'size': self.size})
-        file_store = FileStoreFactory.get_file_store_class()()
-        return file_store.get_url(path, self.key, expiration=3600 * 48)
+
+    def get_url(self, file_store=None):
+        """
+        Returns a signed download URL, using the given file store client if there is one
+        """
+        file_store = file_store or get_file_store()
+        return file_store.get_url(self.path, self.key, expiration=FILE_URL_EXPIRATION_SECONDS)
+
+    @cached_property
+    def url(self):
+        return self.get_url()
 
     def delete_data(self):
         logger.info('Deleting thumbnail', extra={'tags': {'key': self.key, 'frame': self.frame.id, 'thumbnail': self.basename}})
-        path = get_file_store_path(self.filename, {'SITEID': self.frame.site_id, 'INSTRUME': self.frame.instrument_id, 'TELID': self.frame.telescope_id,
-                                                   'DAY-OBS': self.frame.observation_day.strftime('%Y%m%d'), 'DATE-OBS': self.frame.observation_date.isoformat(),
-                                                   'frame_basename': self.frame.basename, 'size': self.size})
-        file_store = FileStoreFactory.get_file_store_class()()
-        file_store.delete_file(path, self.key)
+        get_file_store().delete_file(self.path, self.key)
+
+
+def with_area_geojson(frames):
+    """
+    Select the area of the frames as GeoJSON in the query, instead of loading it as a geometry
+    that has to be converted for every frame
+    """
+    # 15 decimal digits keeps the full precision of the stored coordinates
+    return frames.defer('area').annotate(area_geojson=AsGeoJSON('area', precision=15))
+
+
+def frames_include_urls(include_thumbnails=False, fields=None):
+    """
+    Returns whether serialized frames include signed download URLs
+    """
+    return fields is None or bool(fields & {'version_set', 'url'}) or (include_thumbnails and 'thumbnails' in fields)
+
+
+def frames_as_dicts(frames, include_thumbnails=False, include_related_frames=False, fields=None):
+    """
+    Serialize a page of frames, signing all of their URLs with the same file store client
+    """
+    file_store = get_file_store() if frames_include_urls(include_thumbnails, fields) else None
+    return [frame.as_dict(include_thumbnails, include_related_frames, file_store, fields) for frame in frames]
+
+
+def thumbnails_as_dicts(thumbnails):
+    """
+    Serialize a page of thumbnails, signing all of their URLs with the same file store client.
+    The thumbnails should be fetched with select_related('frame').
+    """
+    file_store = get_file_store()
+    return [thumbnail.as_dict(file_store) for thumbnail in thumbnails]
 
 
 class Headers(models.Model):
@@ -239,27 +345,32 @@ class Version(models.Model):
     class Meta:
         ordering = ['-created']
 
+    @cached_property
+    def path(self):
+        return get_file_store_path(self.frame.filename, self.frame.get_header_dict())
+
     @cached_property
     def size(self):
-        path = get_file_store_path(self.frame.filename, self.frame.get_header_dict())
-        file_store = FileStoreFactory.get_file_store_class()()
-        return file_store.get_file_size(path)
+        return get_file_store().get_file_size(self.path)
+
+    def get_url(self, file_store=None):
+        """
+        Returns a signed download URL, using the given file store client if there is one
+        """
+        file_store = file_store or get_file_store()
+        return file_store.get_url(self.path, self.key, expiration=FILE_URL_EXPIRATION_SECONDS)
 
     @cached_property
     def url(self):
-        path = get_file_store_path(self.frame.filename, self.frame.get_header_dict())
-        file_store = FileStoreFactory.get_file_store_class()()
-        return file_store.get_url(path, self.key, expiration=3600 * 48)
+        return self.get_url()
 
     def delete_data(self):
         logger.info('Deleting version', extra={'tags': {'key': self.key, 'frame': self.frame.id}})
-        path = get_file_store_path(self.frame.filename, self.frame.get_header_dict())
-        file_store = FileStoreFactory.get_file_store_class()()
-        file_store.delete_file(path, self.key)
+        get_file_store().delete_file(self.path, self.key)
 
-    def as_dict(self):
+    def as_dict(self, file_store=None):
         ret_dict = model_to_dict(self, exclude=('frame',))
-        ret_dict['url'] = self.url
+        ret_dict['url'] = self.get_url(file_store)
         ret_dict['created'] = self.created
         return ret_dict
 
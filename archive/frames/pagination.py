@@ -1,4 +1,5 @@
 from rest_framework.pagination import LimitOffsetPagination, CursorPagination
+from archive import metrics, timing
 from django.conf import settings
 from django.db import connections, transaction, OperationalError, InternalError
 from django.utils import dateparse
@@ -9,6 +10,24 @@ import logging
 logger = logging.getLogger(__name__)
 
 
+def is_small_frame_query(query_params):
+    """
+    Returns whether a /frames/ query is filtered on indexed fields, or over a small timerange and other common
+    fields, so that the frames it matches can be counted quickly
+    """
+    if 'request_id' in query_params or 'observation_id' in query_params or 'basename_exact' in query_params:
+        return True
+    if 'start' in query_params and 'end' in query_params:
+        timespan = dateparse.parse_datetime(query_params.get('end')) - dateparse.parse_datetime(query_params.get('start'))
+        # Allow 1 week of querys with no other params
+        if timespan <= timedelta(days=7):
+            return True
+        # Or up to 2 months of querys with some other bounding params
+        if timespan <= timedelta(weeks=9) and any(field in query_params for field in ['proposal_id', 'target_name_exact']):
+            return True
+    return False
+
+
 class CustomCursorPagination(CursorPagination):
     page_size_query_param='limit'
     page_size = settings.PAGINATION_DEFAULT_LIMIT
@@ -22,8 +41,11 @@ class LimitedLimitOffsetPagination(LimitOffsetPagination):
     def __init__(self):
         self.small_query = False
         self.force_count = False
+        # Set by views that have already counted the frames, along with their validators
+        self.known_count = None
         super().__init__()
 
+    @timing.timed('count')
     def get_count(self, queryset):
         """
         Combination of ideas from:
@@ -38,35 +60,47 @@ class LimitedLimitOffsetPagination(LimitOffsetPagination):
         - If any other exception occured fall back to no count (large number returned).
         """
         self.count_estimated = False
+        if self.known_count is not None:
+            metrics.COUNT_OUTCOMES.labels('exact').inc()
+            return self.known_count
+        outcome = 'estimate'
+        # Run every query on the same database, so that the statement timeout applies to the count
+        using = queryset.db
+        queryset = queryset.using(using)
         # Only attempt to get the real count if we have already determined this is a "small" query
         if self.small_query:
             # Limit to 5000 ms if force_count is used, otherwise 1500 ms
             timeout = '5000' if self.force_count else '1500'
             try:
-                with transaction.atomic(using='replica'), connections['replica'].cursor() as cursor:
+                with transaction.atomic(using=using), connections[using].cursor() as cursor:
                     cursor.execute(f'SET LOCAL statement_timeout TO {timeout};')
-                    return super().get_count(queryset)
+                    count = super().get_count(queryset)
+                metrics.COUNT_OUTCOMES.labels('exact').inc()
+                return count
             except (OperationalError, InternalError):
                 logger.warning(f"Getting the count timed out after {timeout} milliseconds")
+                # Counted as a timeout, even if the estimate below succeeds
+                outcome = 'timeout'
 
         self.count_estimated = True
         if not queryset.query.where:
             logger.warning("Estimating the count using postgres stats table")
             try:
-                with transaction.atomic(using='replica'), connections['replica'].cursor() as cursor:
+                with transaction.atomic(using=using), connections[using].cursor() as cursor:
                     # Obtain estimated values (only valid with PostgreSQL)
                     cursor.execute(
                         "SELECT reltuples FROM pg_class WHERE relname = %s",
                         [queryset.query.model._meta.db_table]
                     )
                     estimate = int(cursor.fetchone()[0])
-                    return estimate
+                metrics.COUNT_OUTCOMES.labels(outcome).inc()
+                return estimate
             except Exception as e:
                 logger.warning("Failed to estimate count", exc_info=e)
         else:
             logger.warning("Estimating the count using the postgres query planner")
             try:
-                with transaction.atomic(using='replica'), connections['replica'].cursor() as cursor:
+                with transaction.atomic(using=using), connections[using].cursor() as cursor:
                     # Obtain estimated values using the query planner (only valid with PostgreSQL)
                     sql = cursor.mogrify(*queryset.query.sql_with_params()).decode("utf-8")
                     cursor.execute(
@@ -74,10 +108,12 @@ class LimitedLimitOffsetPagination(LimitOffsetPagination):
                         [sql]
                     )
                     estimate = int(cursor.fetchone()[0])
-                    return estimate
+                metrics.COUNT_OUTCOMES.labels(outcome).inc()
+                return estimate
             except Exception as e:
                 logger.warning("Failed to estimate count", exc_info=e)
 
+        metrics.COUNT_OUTCOMES.labels('failed').inc()
         return sys.maxsize
 
     def paginate_queryset(self, queryset, request, view=None):
@@ -93,20 +129,12 @@ class LimitedLimitOffsetPagination(LimitOffsetPagination):
             self.force_count = True
             self.small_query = True
         # /thumbnails/ queries with indexed fields can have the full count
-        elif request.path == '/thumbnails/' and ('frame_basename' in query_params or 'observation_id' in query_params or 'request_id' in query_params):
+        elif request.path == '/thumbnails/' and any(field in query_params for field in [
+            'frame_basename', 'frame_basenames', 'observation_id', 'observation_ids', 'request_id', 'request_ids'
+        ]):
             self.small_query = True
         elif request.path == '/frames/':
-            # /frames/ queries with indexed fields, or with a small timerange and other common fields.
-            if 'request_id' in query_params or 'observation_id' in query_params or 'basename_exact' in query_params:
-                self.small_query = True
-            elif 'start' in query_params and 'end' in query_params:
-                timespan = dateparse.parse_datetime(request.query_params.get('end')) - dateparse.parse_datetime(request.query_params.get('start'))
-                # Allow 1 week of querys with no other params
-                if timespan <= timedelta(days=7):
-                    self.small_query = True
-                # Or up to 2 months of querys with some other bounding params
-                elif timespan <= timedelta(weeks=9) and any(field in query_params for field in ['proposal_id', 'target_name_exact']):
-                    self.small_query = True
+            self.small_query = is_small_frame_query(request.query_params)
         else:
             self.force_count = False
             self.small_query = False
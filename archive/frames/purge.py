@@ -0,0 +1,278 @@
+"""
+Bulk deletion of frames, along with their versions, thumbnails, headers and data in the file store.
+
+Frames are walked in primary key order and deleted in batches with raw SQL, which avoids the
+per-row work of the ORM's cascading delete and delete signals. The files of each deleted batch
+are removed from the file store by a pool of worker threads while the next batch is deleted.
+Progress is saved to an optional checkpoint file, so an interrupted purge can resume where it
+left off without leaving any files behind. Files that fail to delete are kept in the checkpoint,
+and are tried again when the same purge is run again. A purge can also be planned without deleting anything,
+which estimates how much it will delete and how long that will take.
+"""
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import threading
+import hashlib
+import time
+import logging
+import json
+import os
+
+from django.db import connections, transaction
+
+from archive.frames.models import Frame, Headers, Thumbnail, Version
+from archive.frames.utils import get_file_store
+
+logger = logging.getLogger()
+
+
+class CheckpointMismatch(Exception):
+    pass
+
+
+class FramePurger:
+    def __init__(self, frames, options_key, batch_size=5000, workers=8, checkpoint_file=None, vacuum=False,
+                 using='default'):
+        """
+        frames is a queryset of the frames to delete, and options_key is a string identifying the
+        options it was built from, so that a checkpoint is only resumed by a purge of the same frames.
+        """
+        self.frames = frames.using(using).order_by('pk')
+        self.options_hash = hashlib.sha256(options_key.encode('utf-8')).hexdigest()
+        self.batch_size = batch_size
+        self.workers = workers
+        self.checkpoint_file = checkpoint_file
+        self.vacuum = vacuum
+        self.using = using
+        self.last_pk = 0
+        self.pending_files = set()
+        self.frames_deleted = 0
+        self.files_deleted = 0
+        self.files_failed = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def load_checkpoint(self):
+        if not self.checkpoint_file or not os.path.exists(self.checkpoint_file):
+            return
+        with open(self.checkpoint_file) as checkpoint:
+            state = json.load(checkpoint)
+        if state['options_hash'] != self.options_hash:
+            raise CheckpointMismatch(
+                f'Checkpoint file {self.checkpoint_file} was written by a purge with different options'
+            )
+        self.last_pk = state['last_pk']
+        self.pending_files = {tuple(file) for file in state['pending_files']}
+        logger.info('Resuming purge from checkpoint', extra={'tags': {
+            'last_pk': self.last_pk, 'pending_files': len(self.pending_files)
+        }})
+
+    def save_checkpoint(self, last_pk, pending_files):
+        if not self.checkpoint_file:
+            return
+        state = {'options_hash': self.options_hash, 'last_pk': last_pk, 'pending_files': sorted(pending_files)}
+        # Write to a temporary file and rename it, so a killed run can't leave a partial checkpoint
+        temp_file = f'{self.checkpoint_file}.tmp'
+        with open(temp_file, 'w') as checkpoint:
+            json.dump(state, checkpoint)
+        os.replace(temp_file, self.checkpoint_file)
+
+    def remove_checkpoint(self):
+        if self.checkpoint_file and os.path.exists(self.checkpoint_file):
+            os.remove(self.checkpoint_file)
+
+    def next_batch(self):
+        return list(self.frames.filter(pk__gt=self.last_pk).values_list('pk', flat=True)[:self.batch_size])
+
+    def get_batch_files(self, frame_ids):
+        """
+        Returns the (path, key) of the file store data of every version and thumbnail of the given frames
+        """
+        files = set()
+        frames = (
+            Frame.objects.using(self.using).filter(pk__in=frame_ids)
+            .prefetch_related('version_set', 'thumbnails')
+        )
+        for frame in frames:
+            for version in frame.version_set.all():
+                files.add((version.path, version.key))
+            for thumbnail in frame.thumbnails.all():
+                files.add((thumbnail.path, thumbnail.key))
+        return files
+
+    def batch_rows(self, frame_ids):
+        """
+        Returns the (table, condition, params) of the rows to delete for the given frames, in the order
+        they must be deleted in
+        """
+        related_frames = Frame.related_frames.through._meta
+        from_column = related_frames.get_field('from_frame').column
+        to_column = related_frames.get_field('to_frame').column
+        return [
+            (related_frames.db_table, f'{from_column} = ANY(%s) OR {to_column} = ANY(%s)', [frame_ids, frame_ids]),
+            (Headers._meta.db_table, 'frame_id = ANY(%s)', [frame_ids]),
+            (Version._meta.db_table, 'frame_id = ANY(%s)', [frame_ids]),
+            (Thumbnail._meta.db_table, 'frame_id = ANY(%s)', [frame_ids]),
+            (Frame._meta.db_table, 'id = ANY(%s)', [frame_ids]),
+        ]
+
+    def delete_batch(self, frame_ids):
+        """
+        Delete the given frames and every row that references them, in one transaction
+        """
+        with transaction.atomic(using=self.using), connections[self.using].cursor() as cursor:
+            for table, condition, params in self.batch_rows(frame_ids):
+                cursor.execute(f'DELETE FROM {table} WHERE {condition}', params)
+            return cursor.rowcount
+
+    def vacuum_tables(self):
+        """
+        Mark the space of the deleted rows as reusable and update the planner statistics. Large
+        deletes otherwise leave dead rows behind until autovacuum catches up with them.
+        """
+        tables = [
+            Frame.related_frames.through._meta.db_table, Headers._meta.db_table, Version._meta.db_table,
+            Thumbnail._meta.db_table, Frame._meta.db_table,
+        ]
+        with connections[self.using].cursor() as cursor:
+            for table in tables:
+                logger.info('Vacuuming table after purge', extra={'tags': {'table': table}})
+                cursor.execute(f'VACUUM (ANALYZE) {table}')
+
+    def measure_file_sizes(self, files, file_store):
+        """
+        Returns the total size of the given files and the average time taken per file store call
+        """
+        total_bytes = 0
+        start = time.monotonic()
+        for path, key in files:
+            try:
+                total_bytes += file_store.get_file_size(path)
+            except Exception:
+                logger.warning('Failed to get the size of a file while planning purge', extra={'tags': {'path': path, 'key': key}})
+        seconds_per_call = (time.monotonic() - start) / len(files) if files else 0
+        return total_bytes, seconds_per_call
+
+    def measure_batch_delete(self, frame_ids):
+        """
+        Time finding the rows that deleting a batch of frames would touch, with the same conditions as the
+        deletes. Only SELECTs are run, so nothing is locked or written, and this is a lower bound of the
+        time taken by the deletes themselves.
+        """
+        start = time.monotonic()
+        self.get_batch_files(frame_ids)
+        with connections[self.using].cursor() as cursor:
+            for table, condition, params in self.batch_rows(frame_ids):
+                cursor.execute(f'SELECT COUNT(*) FROM {table} WHERE {condition}', params)
+                cursor.fetchone()
+        return time.monotonic() - start
+
+    def plan(self, sample_size=100):
+        """
+        Count what the purge would delete and estimate how long it would take, without deleting anything.
+        The number of bytes is extrapolated from the sizes of a sample of the files in the file store, as
+        they aren't stored in the database. The runtime is extrapolated from the time taken to find the rows
+        of the first batch of frames, and the file store latency of the sample. No rows are deleted or locked,
+        so the runtime is a lower bound: deletes also write the rows and indexes, and file deletes can be
+        slower than the size lookups.
+        """
+        frame_ids = self.frames.values('pk')
+        counts = {
+            'frames': self.frames.count(),
+            'versions': Version.objects.using(self.using).filter(frame__in=frame_ids).count(),
+            'thumbnails': Thumbnail.objects.using(self.using).filter(frame__in=frame_ids).count(),
+            'headers': Headers.objects.using(self.using).filter(frame__in=frame_ids).count(),
+        }
+        plan = {**counts, 'bytes': 0, 'batch_size': self.batch_size, 'workers': self.workers,
+                'estimated_seconds_lower_bound': 0}
+        batch = self.next_batch()
+        if not batch:
+            return plan
+
+        file_store = get_file_store()
+        sample_frames = (
+            Frame.objects.using(self.using).filter(pk__in=batch[:sample_size])
+            .prefetch_related('version_set', 'thumbnails')
+        )
+        version_files = [(v.path, v.key) for frame in sample_frames for v in frame.version_set.all()][:sample_size]
+        thumbnail_files = [(t.path, t.key) for frame in sample_frames for t in frame.thumbnails.all()][:sample_size]
+        version_bytes, version_seconds = self.measure_file_sizes(version_files, file_store)
+        thumbnail_bytes, thumbnail_seconds = self.measure_file_sizes(thumbnail_files, file_store)
+        if version_files:
+            plan['bytes'] += int(version_bytes / len(version_files) * counts['versions'])
+        if thumbnail_files:
+            plan['bytes'] += int(thumbnail_bytes / len(thumbnail_files) * counts['thumbnails'])
+
+        batch_seconds = self.measure_batch_delete(batch)
+        database_seconds = batch_seconds / len(batch) * counts['frames']
+        # Files are deleted in parallel with the database deletes, so whichever is slower sets the runtime
+        file_seconds = (
+            version_seconds * counts['versions'] + thumbnail_seconds * counts['thumbnails']
+        ) / self.workers
+        plan['sampled_files'] = len(version_files) + len(thumbnail_files)
+        plan['frames_per_second_upper_bound'] = round(len(batch) / batch_seconds, 1) if batch_seconds else None
+        plan['estimated_database_seconds_lower_bound'] = round(database_seconds, 1)
+        plan['estimated_file_store_seconds_lower_bound'] = round(file_seconds, 1)
+        plan['estimated_seconds_lower_bound'] = round(max(database_seconds, file_seconds), 1)
+        return plan
+
+    def delete_file(self, file):
+        # File store clients are not shared between the worker threads
+        if not hasattr(self._local, 'file_store'):
+            self._local.file_store = get_file_store()
+        path, key = file
+        try:
+            self._local.file_store.delete_file(path, key)
+        except Exception:
+            # The file stays pending, so it is saved in the checkpoint and tried again on the next run
+            logger.exception('Failed to delete file from the file store', extra={'tags': {'path': path, 'key': key}})
+            with self._lock:
+                self.files_failed += 1
+        else:
+            with self._lock:
+                self.files_deleted += 1
+                self.pending_files.discard(file)
+
+    def pending_snapshot(self):
+        with self._lock:
+            return set(self.pending_files)
+
+    def run(self):
+        self.load_checkpoint()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='purge') as executor:
+            # Finish deleting the files from a previous, interrupted run first
+            futures = {executor.submit(self.delete_file, file) for file in self.pending_snapshot()}
+            while True:
+                frame_ids = self.next_batch()
+                if not frame_ids:
+                    break
+                files = self.get_batch_files(frame_ids)
+                # Record the files before deleting the rows that reference them, so they can't be lost
+                with self._lock:
+                    self.pending_files |= files
+                self.save_checkpoint(self.last_pk, self.pending_snapshot())
+                frames_deleted = self.delete_batch(frame_ids)
+                self.frames_deleted += frames_deleted
+                self.last_pk = frame_ids[-1]
+                futures |= {executor.submit(self.delete_file, file) for file in files}
+                self.save_checkpoint(self.last_pk, self.pending_snapshot())
+                logger.info('Deleted batch of frames', extra={'tags': {
+                    'frames': frames_deleted, 'files': len(files), 'last_pk': self.last_pk
+                }})
+                # Don't let the file deletions fall too far behind the database deletes
+                while len(futures) > self.batch_size * 2:
+                    done, futures = wait(futures, return_when=FIRST_COMPLETED)
+            wait(futures)
+        self.save_checkpoint(self.last_pk, self.pending_snapshot())
+        if not self.pending_files:
+            self.remove_checkpoint()
+        elif not self.checkpoint_file:
+            logger.error('Files could not be deleted and no checkpoint file was given to retry them from', extra={
+                'tags': {'files': sorted(self.pending_files)}
+            })
+        if self.vacuum and self.frames_deleted:
+            self.vacuum_tables()
+        return {
+            'frames_deleted': self.frames_deleted,
+            'files_deleted': self.files_deleted,
+            'files_failed': self.files_failed,
+        }
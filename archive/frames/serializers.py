@@ -4,10 +4,14 @@ import logging
 
 from rest_framework import serializers
 from archive.frames.models import Frame, Version, Headers, Thumbnail
-from archive.frames.utils import get_configuration_type_tuples, post_to_archived_queue, archived_queue_payload
+from archive.frames.export import EXPORT_FORMATS, EXPORT_COLUMNS, ARROW_FORMATS, arrow_formats_available
+from archive.frames.utils import (
+    get_configuration_type_tuples, post_to_archived_queue, archived_queue_payload, insert_or_get, polygon_geojson
+)
 from django.contrib.gis.geos import GEOSGeometry
 from django.db import transaction
 from django.conf import settings
+from django.utils import timezone
 
 logger = logging.getLogger()
 
@@ -52,7 +56,7 @@ class HeadersSerializer(serializers.ModelSerializer):
 
 class PolygonField(serializers.Field):
     def to_representation(self, obj):
-        return json.loads(obj.geojson)
+        return polygon_geojson(obj)
 
     def to_internal_value(self, data):
         try:
@@ -113,6 +117,25 @@ class FrameSerializer(serializers.ModelSerializer):
                 logger.exception('Failed to post frame to archived queue', extra=logger_tags)
         return frame
 
+    def get_or_create(self, **kwargs):
+        """
+        Create the frame unless one with the same basename already exists, in which case it is left as is.
+        Used when ingesting thumbnails, which can arrive before or after the frame they belong to.
+        Returns the frame, which only has up to date field values if it was created, and whether it was.
+        """
+        frame_data = {**self.validated_data, **kwargs}
+        frame_data.pop('version_set', None)
+        frame_data.pop('related_frames', None)
+        header_data = frame_data.pop('headers')
+        related_frames = frame_data.pop('related_frame_filenames')
+        with transaction.atomic():
+            frame = Frame(**frame_data)
+            created = insert_or_get(frame, 'basename')
+            if created:
+                self.create_or_update_header(frame, header_data)
+                self.create_related_frames(frame, related_frames)
+        return frame, created
+
     def create_or_update_frame(self, data):
         frame, _ = Frame.objects.update_or_create(defaults=data, basename=data['basename'])
         return frame
@@ -125,11 +148,16 @@ class FrameSerializer(serializers.ModelSerializer):
         Headers.objects.update_or_create(defaults={'data': data}, frame=frame)
 
     def create_related_frames(self, frame, data):
+        related_frame_ids = []
         for related_frame in data:
             if related_frame and related_frame != frame.basename:
                 rf, _ = Frame.objects.get_or_create(basename=related_frame)
                 frame.related_frames.add(rf)
+                related_frame_ids.append(rf.id)
         frame.save()
+        # Related frames are symmetrical, so the related frames have changed too
+        if related_frame_ids:
+            Frame.objects.filter(pk__in=related_frame_ids).update(modified=timezone.now())
 
 
 class ThumbnailSerializer(serializers.ModelSerializer):
@@ -145,8 +173,67 @@ class ThumbnailSerializer(serializers.ModelSerializer):
         fields = ['frame', 'size', 'basename', 'url', 'key', 'extension']
 
     def create(self, validated_data):
-        thumbnail, _ = Thumbnail.objects.update_or_create(defaults=validated_data, basename=validated_data['basename'])
-        return thumbnail
+        return self.upsert([validated_data])[0]
+
+    @staticmethod
+    def upsert(thumbnails_data):
+        """
+        Create or update thumbnails by basename in a single INSERT ... ON CONFLICT DO UPDATE statement
+        """
+        # A statement can't update the same row twice, so only the last of any repeated basenames is kept
+        thumbnails = {thumbnail_data['basename']: Thumbnail(**thumbnail_data) for thumbnail_data in thumbnails_data}
+        thumbnails = Thumbnail.objects.bulk_create(
+            list(thumbnails.values()),
+            update_conflicts=True,
+            unique_fields=['basename'],
+            update_fields=['frame', 'size', 'extension', 'key']
+        )
+        # Mark the frames as modified, so that cached frame responses with thumbnails are revalidated
+        Frame.objects.filter(pk__in={thumbnail.frame_id for thumbnail in thumbnails}).update(modified=timezone.now())
+        return thumbnails
+
+
+class ThumbnailLookupSerializer(serializers.Serializer):
+    frame_basenames = serializers.ListField(
+        child=serializers.CharField(), required=False, max_length=settings.THUMBNAIL_LOOKUP_MAX_FRAMES,
+        help_text='Basenames of the frames to get thumbnails for'
+    )
+    observation_ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=0), required=False, max_length=settings.THUMBNAIL_LOOKUP_MAX_FRAMES,
+        help_text='Observation IDs of the frames to get thumbnails for'
+    )
+    sizes = serializers.ListField(
+        child=serializers.ChoiceField(choices=settings.THUMBNAIL_SIZE_CHOICES), required=False,
+        help_text='Sizes of thumbnails to return, defaults to all sizes'
+    )
+
+    def validate(self, data):
+        if not data.get('frame_basenames') and not data.get('observation_ids'):
+            raise serializers.ValidationError('At least one of frame_basenames or observation_ids must be specified')
+        return data
+
+
+class FrameExportQueryParamsSerializer(serializers.Serializer):
+    export_format = serializers.ChoiceField(choices=tuple(EXPORT_FORMATS), required=False, default='ndjson')
+    columns = serializers.CharField(required=False, default='')
+    include_urls = serializers.BooleanField(required=False, default=False)
+
+    def validate_columns(self, value):
+        columns = [column.strip() for column in value.split(',') if column.strip()]
+        unknown_columns = [column for column in columns if column not in EXPORT_COLUMNS]
+        if unknown_columns:
+            raise serializers.ValidationError('Unknown columns: {}. Choices are {}'.format(
+                ', '.join(unknown_columns), ', '.join(EXPORT_COLUMNS)
+            ))
+        return columns or list(EXPORT_COLUMNS)
+
+    def validate(self, data):
+        if data['export_format'] in ARROW_FORMATS:
+            if not arrow_formats_available():
+                raise serializers.ValidationError({'export_format': 'Arrow and Parquet exports are not available on this server'})
+            if data['include_urls']:
+                raise serializers.ValidationError({'include_urls': 'Signed URLs are only available in NDJSON and CSV exports'})
+        return data
 
 
 class AggregateSerializer(serializers.Serializer):
@@ -1,18 +1,27 @@
 from archive.frames.tests.factories import FrameFactory, VersionFactory, PublicFrameFactory, ThumbnailFactory
 from archive.frames.models import Frame, Thumbnail, Version
-from archive.frames.utils import get_configuration_type_tuples, aggregate_frames_sql, set_cached_frames_aggregates
+from archive.frames.serializers import ThumbnailSerializer
+from archive.frames.export import arrow_formats_available
+from archive import metrics
+from archive.frames.utils import (
+    get_configuration_type_tuples, aggregate_frames_sql, set_cached_frames_aggregates, frame_visibility_filter,
+    get_file_store
+)
 from archive.authentication.models import Profile
 from archive.frames.signals.handlers import version_post_delete
 from rest_framework.authtoken.models import Token
 from django.contrib.auth.models import User
-from unittest.mock import MagicMock, patch
+from unittest.mock import MagicMock, PropertyMock, patch
 from django.urls import reverse
 from rest_framework.reverse import reverse as reverse_drf
 from archive.test_helpers import ReplicationTestCase
 from django.test import override_settings
+from unittest import skipUnless
 from django.conf import settings
 from django.db.models import signals
-from django.contrib.gis.geos import Point
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.contrib.gis.geos import Point, GEOSGeometry
 from rest_framework import status
 from django.core.cache import cache
 
@@ -24,6 +33,7 @@ import os
 import random
 import subprocess
 import copy
+import io
 
 from ocs_archive.input.file import EmptyFile
 from ocs_archive.input.fitsfile import FitsFile
@@ -81,6 +91,13 @@ class TestFrameGet(ReplicationTestCase):
         # Enable post delete version signal
         signals.post_delete.connect(version_post_delete, sender=Version)
 
+    def test_get_frame_list_server_timing(self):
+        response = self.client.get(reverse('frame-list'))
+        metrics = [metric.split(';')[0] for metric in response['Server-Timing'].split(', ')]
+        for metric in ['count', 'serialize', 'storage', 'render', 'total']:
+            self.assertIn(metric, metrics)
+        self.assertTrue(any(metric.startswith('db_') for metric in metrics))
+
     def test_get_frame_list_exclude_related_frames(self):
         response = self.client.get(reverse('frame-list'),
                                    {'include_related_frames': False, 'force_count': True})
@@ -121,6 +138,311 @@ class TestFrameGet(ReplicationTestCase):
         self.patcher.stop()
 
 
+class TestFrameGetFields(ReplicationTestCase):
+    def setUp(self):
+        user = User.objects.create(username='admin', password='admin', is_superuser=True)
+        user.backend = settings.AUTHENTICATION_BACKENDS[0]
+        self.client.force_login(user)
+        self.frames = FrameFactory.create_batch(5)
+
+    def test_frame_list_only_returns_requested_fields(self):
+        response = self.client.get(reverse('frame-list'), {'fields': 'basename,observation_date'})
+        for frame in response.json()['results']:
+            self.assertEqual(set(frame), {'id', 'basename', 'observation_date'})
+
+    def test_frame_list_omits_fields(self):
+        response = self.client.get(reverse('frame-list'), {'omit': 'version_set,area,PROPID'})
+        frame = response.json()['results'][0]
+        self.assertNotIn('version_set', frame)
+        self.assertNotIn('area', frame)
+        self.assertNotIn('PROPID', frame)
+        self.assertIn('url', frame)
+        self.assertIn('DATE_OBS', frame)
+
+    def test_frame_detail_only_returns_requested_fields(self):
+        response = self.client.get(reverse('frame-detail', args=(self.frames[0].id,)), {'fields': 'filename,PROPID'})
+        self.assertEqual(response.json(), {
+            'id': self.frames[0].id, 'filename': self.frames[0].filename, 'PROPID': self.frames[0].proposal_id
+        })
+
+    def test_frame_list_skips_signing_urls_and_versions(self):
+        with patch('archive.frames.models.get_file_store', wraps=get_file_store) as get_file_store_mock:
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(reverse('frame-list'), {'fields': 'basename,observation_date', 'force_count': True})
+        self.assertEqual(get_file_store_mock.call_count, 0)
+        # The versions aren't prefetched
+        self.assertFalse(any('"frames_version"."key"' in query['sql'] for query in queries))
+
+    def test_frame_list_excludes_legacy_fields(self):
+        response = self.client.get(reverse('frame-list'), {'include_legacy_fields': False})
+        frame = response.json()['results'][0]
+        self.assertIn('proposal_id', frame)
+        self.assertIn('version_set', frame)
+        self.assertFalse(any(field in frame for field in ['DATE_OBS', 'PROPID', 'REQNUM']))
+
+    def test_frame_detail_excludes_legacy_fields(self):
+        response = self.client.get(
+            reverse('frame-detail', args=(self.frames[0].id,)), {'include_legacy_fields': False, 'fields': 'DATE_OBS,basename'}
+        )
+        self.assertEqual(set(response.json()), {'id', 'basename'})
+
+    def test_frame_list_selects_area_as_geojson(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('frame-list'), {'fields': 'area'})
+        self.assertTrue(any('ST_AsGeoJSON' in query['sql'] for query in queries))
+        areas = {frame['id']: frame['area'] for frame in response.json()['results']}
+        for frame in self.frames:
+            self.assertEqual(areas[frame.id]['type'], 'Polygon')
+            for point, expected_point in zip(areas[frame.id]['coordinates'][0], frame.area.coords[0]):
+                self.assertAlmostEqual(point[0], expected_point[0])
+                self.assertAlmostEqual(point[1], expected_point[1])
+
+    def test_frame_list_rejects_unknown_fields(self):
+        response = self.client.get(reverse('frame-list'), {'fields': 'basename,password'})
+        self.assertEqual(response.status_code, 400)
+
+
+class TestFrameGetThumbnails(ReplicationTestCase):
+    def setUp(self):
+        user = User.objects.create(username='admin', password='admin', is_superuser=True)
+        user.backend = settings.AUTHENTICATION_BACKENDS[0]
+        self.client.force_login(user)
+        self.frames = FrameFactory.create_batch(5)
+        for frame in self.frames:
+            for size in ['small', 'medium', 'large']:
+                ThumbnailFactory(frame=frame, size=size)
+
+    def test_frame_list_includes_thumbnails(self):
+        response = self.client.get(reverse('frame-list'), {'include_thumbnails': True})
+        for frame in response.json()['results']:
+            self.assertEqual(set(thumbnail['size'] for thumbnail in frame['thumbnails']), {'small', 'medium', 'large'})
+
+    def test_frame_list_includes_thumbnails_of_requested_sizes(self):
+        response = self.client.get(reverse('frame-list'), {'include_thumbnails': True, 'thumbnail_sizes': 'small'})
+        for frame in response.json()['results']:
+            self.assertEqual([thumbnail['size'] for thumbnail in frame['thumbnails']], ['small'])
+
+    def test_frame_detail_includes_thumbnails(self):
+        response = self.client.get(
+            reverse('frame-detail', args=(self.frames[0].id,)), {'include_thumbnails': True, 'thumbnail_sizes': 'small,large'}
+        )
+        self.assertEqual(set(thumbnail['size'] for thumbnail in response.json()['thumbnails']), {'small', 'large'})
+
+    def test_frame_list_thumbnails_queries_do_not_depend_on_page_size(self):
+        with CaptureQueriesContext(connection) as small_page:
+            self.client.get(reverse('frame-list'), {'include_thumbnails': True, 'limit': 1})
+        with CaptureQueriesContext(connection) as large_page:
+            self.client.get(reverse('frame-list'), {'include_thumbnails': True, 'limit': 5})
+        self.assertEqual(len(small_page), len(large_page))
+
+    def test_frame_list_signs_urls_with_one_file_store(self):
+        with patch('archive.frames.models.get_file_store', wraps=get_file_store) as get_file_store_mock:
+            self.client.get(reverse('frame-list'), {'include_thumbnails': True})
+        self.assertEqual(get_file_store_mock.call_count, 1)
+
+
+class TestFrameConditionalGet(ReplicationTestCase):
+    def setUp(self):
+        user = User.objects.create(username='admin', password='admin', is_superuser=True)
+        user.backend = settings.AUTHENTICATION_BACKENDS[0]
+        self.client.force_login(user)
+        self.frame = FrameFactory.create()
+
+    def test_frame_detail_not_modified(self):
+        url = reverse('frame-detail', args=(self.frame.id,))
+        response = self.client.get(url)
+        self.assertTrue(response.has_header('ETag'))
+        self.assertTrue(response.has_header('Last-Modified'))
+        with patch('archive.frames.models.get_file_store') as get_file_store_mock:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        # The frame isn't serialized, so no URLs are signed
+        self.assertEqual(get_file_store_mock.call_count, 0)
+
+    def test_frame_detail_not_modified_since(self):
+        url = reverse('frame-detail', args=(self.frame.id,))
+        response = self.client.get(url)
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_frame_detail_modified(self):
+        url = reverse('frame-detail', args=(self.frame.id,))
+        etag = self.client.get(url)['ETag']
+        self.frame.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_frame_detail_modified_by_new_version(self):
+        url = reverse('frame-detail', args=(self.frame.id,))
+        etag = self.client.get(url)['ETag']
+        VersionFactory(frame=self.frame)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_frame_detail_etag_depends_on_query_parameters(self):
+        url = reverse('frame-detail', args=(self.frame.id,))
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, {'fields': 'basename'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_frame_headers_not_modified(self):
+        url = reverse('frame-headers', args=(self.frame.id,))
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_frame_list_not_modified(self):
+        params = {'request_id': self.frame.request_id}
+        response = self.client.get(reverse('frame-list'), params)
+        self.assertEqual(response.json()['count'], 1)
+        response = self.client.get(reverse('frame-list'), params, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_frame_list_validators_add_no_queries(self):
+        params = {'request_id': self.frame.request_id}
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('frame-list'), params)
+        self.assertTrue(response.has_header('ETag'))
+        self.assertEqual(response.json()['count'], 1)
+        with patch('archive.frames.views.is_small_frame_query', return_value=False):
+            with CaptureQueriesContext(connection) as queries_without_validators:
+                response = self.client.get(reverse('frame-list'), params)
+        self.assertFalse(response.has_header('ETag'))
+        self.assertEqual(len(queries), len(queries_without_validators))
+
+    def test_frame_list_modified_by_new_frame(self):
+        params = {'request_id': self.frame.request_id}
+        etag = self.client.get(reverse('frame-list'), params)['ETag']
+        FrameFactory.create(request_id=self.frame.request_id)
+        response = self.client.get(reverse('frame-list'), params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['count'], 2)
+
+    def test_unbounded_frame_list_has_no_validators(self):
+        response = self.client.get(reverse('frame-list'))
+        self.assertFalse(response.has_header('ETag'))
+
+    def test_thumbnails_modify_frame(self):
+        modified = self.frame.modified
+        ThumbnailSerializer.upsert([{
+            'frame_id': self.frame.id, 'size': 'small', 'basename': 'thumbnail', 'extension': '.jpg', 'key': 'key'
+        }])
+        self.frame.refresh_from_db()
+        self.assertGreater(self.frame.modified, modified)
+
+
+@skipUnless(metrics.metrics_available(), 'prometheus_client is not installed')
+class TestMetrics(ReplicationTestCase):
+    def setUp(self):
+        user = User.objects.create(username='admin', password='admin', is_superuser=True)
+        user.backend = settings.AUTHENTICATION_BACKENDS[0]
+        self.client.force_login(user)
+        self.frame = FrameFactory.create()
+
+    def get_sample_value(self, name, labels):
+        return metrics.prometheus_client.REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_frame_requests_are_timed(self):
+        before = self.get_sample_value('archive_frame_request_seconds_count', {'action': 'list'})
+        self.client.get(reverse('frame-list'))
+        self.assertEqual(self.get_sample_value('archive_frame_request_seconds_count', {'action': 'list'}), before + 1)
+
+    def test_count_outcomes(self):
+        before = self.get_sample_value('archive_count_outcomes_total', {'outcome': 'exact'})
+        self.client.get(reverse('frame-list'), {'force_count': True})
+        self.assertEqual(self.get_sample_value('archive_count_outcomes_total', {'outcome': 'exact'}), before + 1)
+
+    @override_settings(METRICS_ENABLED=True)
+    def test_metrics_endpoint(self):
+        self.client.get(reverse('frame-detail', args=(self.frame.id,)))
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'archive_frame_request_seconds_bucket{action="retrieve"')
+
+    def test_metrics_endpoint_disabled_by_default(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)
+
+    @override_settings(METRICS_ENABLED=True, METRICS_TOKEN='secret')
+    def test_metrics_endpoint_requires_token(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+
+
+class TestFrameExport(ReplicationTestCase):
+    def setUp(self):
+        user = User.objects.create(username='admin', password='admin', is_superuser=True)
+        user.backend = settings.AUTHENTICATION_BACKENDS[0]
+        self.client.force_login(user)
+        self.frames = FrameFactory.create_batch(5)
+
+    def get_export(self, params):
+        response = self.client.get(reverse('frame-export'), params)
+        content = b''.join(response.streaming_content)
+        if params.get('export_format') in ('arrow', 'parquet'):
+            return response, content
+        return response, content.decode('utf-8')
+
+    def test_export_ndjson(self):
+        response, content = self.get_export({})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual({row['basename'] for row in rows}, {frame.basename for frame in self.frames})
+        self.assertNotIn('url', rows[0])
+
+    def test_export_csv_with_selected_columns(self):
+        response, content = self.get_export({'export_format': 'csv', 'columns': 'basename,filename'})
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        lines = content.splitlines()
+        self.assertEqual(lines[0], 'basename,filename')
+        self.assertEqual(len(lines), 6)
+        self.assertIn('{},{}'.format(self.frames[0].basename, self.frames[0].filename), lines)
+
+    def test_export_uses_frame_filters(self):
+        _, content = self.get_export({'basename_exact': self.frames[0].basename, 'columns': 'id'})
+        self.assertEqual([json.loads(line) for line in content.splitlines()], [{'id': self.frames[0].id}])
+
+    def test_export_includes_urls(self):
+        with patch('archive.frames.export.get_file_store', wraps=get_file_store) as get_file_store_mock:
+            _, content = self.get_export({'columns': 'id', 'include_urls': True})
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertTrue(all(row['url'] for row in rows))
+        self.assertEqual(get_file_store_mock.call_count, 1)
+
+    def test_export_rejects_unknown_columns(self):
+        response = self.client.get(reverse('frame-export'), {'columns': 'basename,password'})
+        self.assertEqual(response.status_code, 400)
+
+    @skipUnless(arrow_formats_available(), 'pyarrow is not installed')
+    def test_export_arrow(self):
+        import pyarrow
+        _, content = self.get_export({'export_format': 'arrow', 'columns': 'id,filename,observation_date,area'})
+        table = pyarrow.ipc.open_stream(content).read_all()
+        self.assertEqual(table.num_rows, 5)
+        self.assertEqual(str(table.schema.field('observation_date').type), 'timestamp[us, tz=UTC]')
+        self.assertIn(self.frames[0].filename, table.column('filename').to_pylist())
+        area = table.column('area').to_pylist()[table.column('id').to_pylist().index(self.frames[0].id)]
+        self.assertTrue(GEOSGeometry(memoryview(area)).equals_exact(self.frames[0].area, 1e-9))
+
+    @skipUnless(arrow_formats_available(), 'pyarrow is not installed')
+    def test_export_parquet(self):
+        import pyarrow.parquet
+        _, content = self.get_export({'export_format': 'parquet', 'columns': 'basename,exposure_time'})
+        table = pyarrow.parquet.read_table(io.BytesIO(content))
+        self.assertEqual(set(table.column('basename').to_pylist()), {frame.basename for frame in self.frames})
+        self.assertEqual(str(table.schema.field('exposure_time').type), 'double')
+
+    def test_arrow_export_rejects_urls(self):
+        response = self.client.get(reverse('frame-export'), {'export_format': 'parquet', 'include_urls': True})
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(FRAME_EXPORT_CHUNK_SIZE=2)
+    def test_export_streams_in_chunks(self):
+        response = self.client.get(reverse('frame-export'), {'columns': 'id'})
+        chunks = list(response.streaming_content)
+        self.assertEqual(len(chunks), 3)
+
+
 class TestFramePost(ReplicationTestCase):
     def setUp(self):
         user = User.objects.create(username='admin', password='admin', is_superuser=True)
@@ -305,6 +627,28 @@ class TestFrameFiltering(ReplicationTestCase):
         self.assertNotContains(response, self.proposal_frame.basename)
         self.assertNotContains(response, self.not_owned.basename)
 
+    def test_proposal_user_with_many_proposals(self):
+        self.client.force_login(self.normal_user)
+        queries = []
+        for num_proposals in (1, 50, 500):
+            proposals = ['prop1'] + ['otherprop{}'.format(i) for i in range(num_proposals - 1)]
+            with patch.object(Profile, 'proposals', new_callable=PropertyMock, return_value=proposals):
+                response = self.client.get(reverse('frame-list'))
+                self.assertContains(response, self.public_frame.basename)
+                self.assertContains(response, self.proposal_frame.basename)
+                self.assertNotContains(response, self.not_owned.basename)
+                sql, params = Frame.objects.filter(frame_visibility_filter(self.normal_user)).query.sql_with_params()
+                self.assertIn(proposals, params)
+                queries.append(sql)
+        # The proposals are a single parameter, so the query is the same however many there are
+        self.assertEqual(len(set(queries)), 1)
+
+    def test_proposal_user_without_proposals(self):
+        with patch.object(Profile, 'proposals', new_callable=PropertyMock, return_value=[]):
+            sql, _ = Frame.objects.filter(frame_visibility_filter(self.normal_user)).query.sql_with_params()
+        self.assertNotIn('ANY', sql)
+        self.assertIsNone(frame_visibility_filter(self.admin_user))
+
 
 class TestQueryFiltering(ReplicationTestCase):
     def test_start_end(self):
@@ -856,6 +1200,15 @@ class TestThumbnailGet(ReplicationTestCase):
         response = self.client.get(reverse('thumbnail-list') + '?proposal_id=' + self.thumbnails[0].frame.proposal_id)
         self.assertContains(response, self.thumbnails[0].frame.id)
 
+    def test_get_thumbnail_list_signs_urls_with_one_file_store(self):
+        with patch('archive.frames.models.get_file_store', wraps=get_file_store) as get_file_store_mock:
+            response = self.client.get(reverse('thumbnail-list'))
+        self.assertEqual(get_file_store_mock.call_count, 1)
+        thumbnail = next(t for t in response.json()['results'] if t['id'] == self.thumbnail.id)
+        self.assertEqual(thumbnail['frame'], self.thumbnail.frame.id)
+        self.assertEqual(thumbnail['basename'], self.thumbnail.basename)
+        self.assertIn('url', thumbnail)
+
 
 class TestThumbnailFiltering(ReplicationTestCase):
     def setUp(self):
@@ -902,6 +1255,55 @@ class TestThumbnailFiltering(ReplicationTestCase):
         self.assertContains(response, self.public_frame.id)
         self.assertNotContains(response, self.proposal_frame.id)
 
+    def test_filter_by_many_frame_basenames(self):
+        self.client.force_login(self.admin_user)
+        response = self.client.get(
+            reverse('thumbnail-list') + '?frame_basenames={},{}'.format(self.public_frame.basename, self.not_owned.basename)
+        )
+        self.assertEqual(response.json()['count'], 2)
+        returned_frames = set(thumbnail['frame'] for thumbnail in response.json()['results'])
+        self.assertEqual(returned_frames, {self.public_frame.id, self.not_owned.id})
+
+    def test_lookup_groups_by_frame_and_size(self):
+        ThumbnailFactory(frame=self.public_frame, size='large' if self.public_thumbnail.size != 'large' else 'small')
+        self.client.force_login(self.admin_user)
+        response = self.client.post(
+            reverse('thumbnail-lookup'),
+            data={'frame_basenames': [self.public_frame.basename, self.proposal_frame.basename]},
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual(set(results.keys()), {self.public_frame.basename, self.proposal_frame.basename})
+        self.assertEqual(len(results[self.public_frame.basename]), 2)
+        self.assertEqual(
+            results[self.proposal_frame.basename][self.proposal_thumbnail.size]['basename'], self.proposal_thumbnail.basename
+        )
+
+    def test_lookup_by_observation_id_and_size(self):
+        self.client.force_login(self.admin_user)
+        response = self.client.post(
+            reverse('thumbnail-lookup'),
+            data={'observation_ids': [self.not_owned.observation_id], 'sizes': [self.not_owned_thumbnail.size]},
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(self.not_owned.basename, response.json()['results'])
+
+    def test_lookup_only_returns_visible_thumbnails(self):
+        self.client.logout()
+        response = self.client.post(
+            reverse('thumbnail-lookup'),
+            data={'frame_basenames': [self.public_frame.basename, self.not_owned.basename]},
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.json()['results'].keys()), [self.public_frame.basename])
+
+    def test_lookup_requires_frames(self):
+        response = self.client.post(reverse('thumbnail-lookup'), data={'sizes': ['small']}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
 
 class TestThumbnailPost(ReplicationTestCase):
     def setUp(self):
@@ -1013,6 +1415,64 @@ class TestThumbnailPost(ReplicationTestCase):
             self.assertEqual(response.status_code, 201)
         self.assertEqual(Thumbnail.objects.count(), 1)
 
+    def get_bulk_thumbnail_payload(self):
+        payloads = []
+        for size in ['small', 'medium', 'large']:
+            payload = copy.deepcopy(self.single_thumbnail_payload)
+            payload['size'] = size
+            payload['basename'] = 'test_{}'.format(size)
+            payloads.append(payload)
+        return payloads
+
+    def test_bulk_thumbnails_create_one_frame(self):
+        response = self.client.post(
+            reverse('thumbnail-bulk'), json.dumps(self.get_bulk_thumbnail_payload()), content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 201)
+        frame = Frame.objects.get(basename=self.single_thumbnail_payload['frame_basename'])
+        self.assertEqual(set(frame.thumbnails.values_list('size', flat=True)), {'small', 'medium', 'large'})
+        self.assertEqual({thumbnail['frame'] for thumbnail in response.json()}, {frame.id})
+        self.assertIsNotNone(frame.headers)
+        self.mock_archive_fits_publish.assert_not_called()
+
+    def test_bulk_thumbnails_are_idempotent(self):
+        payload = self.get_bulk_thumbnail_payload()
+        first_response = self.client.post(reverse('thumbnail-bulk'), json.dumps(payload), content_type='application/json')
+        payload[0]['version_set'][0]['key'] = 'newkey'
+        second_response = self.client.post(reverse('thumbnail-bulk'), json.dumps(payload), content_type='application/json')
+        self.assertEqual(second_response.status_code, 201)
+        self.assertEqual(Frame.objects.filter(basename=self.single_thumbnail_payload['frame_basename']).count(), 1)
+        self.assertEqual(Thumbnail.objects.count(), 3)
+        self.assertEqual(
+            [thumbnail['id'] for thumbnail in first_response.json()], [thumbnail['id'] for thumbnail in second_response.json()]
+        )
+        self.assertEqual(Thumbnail.objects.get(basename='test_small').key, 'newkey')
+
+    def test_bulk_thumbnails_use_existing_frame(self):
+        frame = FrameFactory(basename=self.single_thumbnail_payload['frame_basename'], proposal_id='existing')
+        response = self.client.post(
+            reverse('thumbnail-bulk'), json.dumps(self.get_bulk_thumbnail_payload()), content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 201)
+        frame.refresh_from_db()
+        self.assertEqual(frame.proposal_id, 'existing')
+        self.assertEqual(frame.thumbnails.count(), 3)
+
+    def test_bulk_thumbnails_invalid_saves_nothing(self):
+        payload = self.get_bulk_thumbnail_payload()
+        del payload[2]['size']
+        response = self.client.post(reverse('thumbnail-bulk'), json.dumps(payload), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Thumbnail.objects.count(), 0)
+        self.assertFalse(Frame.objects.filter(basename=self.single_thumbnail_payload['frame_basename']).exists())
+
+    def test_bulk_thumbnails_non_object_items_rejected(self):
+        payload = self.get_bulk_thumbnail_payload()[:1] + [1, 'x']
+        response = self.client.post(reverse('thumbnail-bulk'), json.dumps(payload), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('non_field_errors', response.json())
+        self.assertEqual(Thumbnail.objects.count(), 0)
+
 
 class TestUtils(ReplicationTestCase):
     def setUp(self):
@@ -1,6 +1,18 @@
-from archive.frames.tests.factories import FrameFactory
-from unittest.mock import patch
+from archive.frames.tests.factories import FrameFactory, ThumbnailFactory
+from archive.frames.models import Frame, Headers, Thumbnail, Version
+from archive.frames.purge import FramePurger
+from unittest.mock import MagicMock, patch
 from archive.test_helpers import ReplicationTestCase
+from django.core.management import call_command, CommandError
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+
+import datetime
+import tempfile
+import io
+import json
+import os
+
 
 class TestVersion(ReplicationTestCase):
 
@@ -9,3 +21,110 @@ class TestVersion(ReplicationTestCase):
         frame = FrameFactory()
         frame.delete()
         self.assertTrue(mock.called)
+
+
+class TestDeleteFrames(ReplicationTestCase):
+    def setUp(self):
+        old_date = datetime.datetime(2016, 1, 1, tzinfo=datetime.timezone.utc)
+        self.old_frames = FrameFactory.create_batch(3, observation_date=old_date)
+        self.new_frame = FrameFactory(observation_date=datetime.datetime.now(datetime.timezone.utc))
+        self.old_frames[0].related_frames.add(self.new_frame)
+        for frame in self.old_frames + [self.new_frame]:
+            ThumbnailFactory(frame=frame)
+        self.file_store = MagicMock()
+        file_store_patcher = patch('archive.frames.purge.get_file_store', return_value=self.file_store)
+        file_store_patcher.start()
+        self.addCleanup(file_store_patcher.stop)
+        self.checkpoint_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.checkpoint_dir.cleanup)
+        self.checkpoint_file = os.path.join(self.checkpoint_dir.name, 'checkpoint.json')
+
+    def test_deletes_frames_and_files(self):
+        old_ids = [frame.id for frame in self.old_frames]
+        old_keys = set(Version.objects.filter(frame__in=old_ids).values_list('key', flat=True))
+        old_keys |= set(Thumbnail.objects.filter(frame__in=old_ids).values_list('key', flat=True))
+        call_command('deleteframes', '--days-old', '365', '--batch-size', '2', '--workers', '2')
+        self.assertEqual(list(Frame.objects.all()), [self.new_frame])
+        self.assertFalse(Version.objects.filter(frame__in=old_ids).exists())
+        self.assertFalse(Thumbnail.objects.filter(frame__in=old_ids).exists())
+        self.assertFalse(Headers.objects.filter(frame__in=old_ids).exists())
+        self.assertFalse(self.new_frame.related_frames.exists())
+        deleted_keys = set(call[0][1] for call in self.file_store.delete_file.call_args_list)
+        self.assertEqual(deleted_keys, old_keys)
+
+    def test_resumes_from_checkpoint(self):
+        frames = Frame.objects.filter(pk__in=[frame.id for frame in self.old_frames])
+        purger = FramePurger(frames, 'test', batch_size=1, checkpoint_file=self.checkpoint_file)
+        purger.save_checkpoint(self.old_frames[0].id, {('left/over/path', 'leftoverkey')})
+
+        results = FramePurger(frames, 'test', batch_size=1, checkpoint_file=self.checkpoint_file).run()
+        self.assertEqual(results['frames_deleted'], 2)
+        self.assertTrue(Frame.objects.filter(pk=self.old_frames[0].id).exists())
+        self.file_store.delete_file.assert_any_call('left/over/path', 'leftoverkey')
+        self.assertFalse(os.path.exists(self.checkpoint_file))
+
+    def test_failed_file_deletes_are_retried_on_resume(self):
+        frames = Frame.objects.filter(pk__in=[frame.id for frame in self.old_frames])
+        failing_key = Thumbnail.objects.get(frame=self.old_frames[0]).key
+
+        def delete_file(path, key):
+            if key == failing_key:
+                raise Exception('File store unavailable')
+        self.file_store.delete_file.side_effect = delete_file
+        results = FramePurger(frames, 'test', checkpoint_file=self.checkpoint_file).run()
+        self.assertEqual(results['files_failed'], 1)
+        with open(self.checkpoint_file) as checkpoint:
+            pending_files = json.load(checkpoint)['pending_files']
+        self.assertEqual([key for _, key in pending_files], [failing_key])
+
+        self.file_store.delete_file.reset_mock(side_effect=True)
+        results = FramePurger(frames, 'test', checkpoint_file=self.checkpoint_file).run()
+        self.assertEqual(results['files_deleted'], 1)
+        self.file_store.delete_file.assert_called_once_with(pending_files[0][0], failing_key)
+        self.assertFalse(os.path.exists(self.checkpoint_file))
+
+    def test_checkpoint_from_different_options(self):
+        with open(self.checkpoint_file, 'w') as checkpoint:
+            json.dump({'options_hash': 'different', 'last_pk': 0, 'pending_files': []}, checkpoint)
+        with self.assertRaises(CommandError):
+            call_command('deleteframes', '--days-old', '365', '--checkpoint-file', self.checkpoint_file)
+        self.assertEqual(Frame.objects.count(), 4)
+
+    def test_dry_run_prints_plan(self):
+        self.file_store.get_file_size.return_value = 1000
+        out = io.StringIO()
+        err = io.StringIO()
+        with CaptureQueriesContext(connections['default']) as queries:
+            call_command('deleteframes', '--days-old', '365', '--dry-run', stdout=out, stderr=err)
+        self.assertFalse([query for query in queries.captured_queries if 'DELETE' in query['sql'].upper()])
+        plan = json.loads(out.getvalue())
+        old_ids = [frame.id for frame in self.old_frames]
+        self.assertEqual(plan['frames'], 3)
+        self.assertEqual(plan['versions'], Version.objects.filter(frame__in=old_ids).count())
+        self.assertEqual(plan['thumbnails'], 3)
+        self.assertEqual(plan['headers'], Headers.objects.filter(frame__in=old_ids).count())
+        self.assertEqual(plan['bytes'], 1000 * (plan['versions'] + plan['thumbnails']))
+        self.assertIn('estimated_seconds_lower_bound', plan)
+        self.assertIn('lower bound', err.getvalue())
+        # Nothing was deleted
+        self.assertEqual(Frame.objects.count(), 4)
+        self.assertEqual(Thumbnail.objects.count(), 4)
+        self.file_store.delete_file.assert_not_called()
+
+    @patch('archive.frames.purge.FramePurger.vacuum_tables')
+    def test_vacuum_after_purge(self, vacuum_mock):
+        call_command('deleteframes', '--days-old', '365', '--vacuum')
+        self.assertTrue(vacuum_mock.called)
+        self.assertEqual(Frame.objects.count(), 1)
+
+
+class TestBenchmarkVisibility(ReplicationTestCase):
+    def test_compares_filters_for_each_proposal_count(self):
+        FrameFactory.create_batch(3)
+        out = io.StringIO()
+        call_command('benchmarkvisibility', '--iterations', '1', stdout=out)
+        results = json.loads(out.getvalue())
+        self.assertEqual([result['proposals'] for result in results], [1, 50, 500])
+        for result in results:
+            self.assertIn('in_median_ms', result)
+            self.assertIn('any_median_ms', result)
@@ -1,3 +1,4 @@
+import datetime
 import logging
 import subprocess
 import io
@@ -6,13 +7,17 @@ from urllib.parse import urlsplit, urljoin
 from django.conf import settings
 from django.core.cache import cache
 from django.urls import reverse
-from django.db import connections
+from django.db import connections, router, transaction
+from django.db.models import Q
+from django.db.models.constants import OnConflict
 from django.db.models.query import EmptyQuerySet
+from django.db.models.sql import InsertQuery
 from astropy.io import fits
 
 from kombu.connection import Connection
 from kombu import Exchange
 
+from archive import http_client, metrics, timing
 from archive.frames.exceptions import FunpackError
 
 from ocs_archive.input.file import EmptyFile
@@ -21,6 +26,9 @@ from ocs_archive.storage.filestorefactory import FileStoreFactory
 
 logger = logging.getLogger()
 
+# How long signed download URLs stay valid for
+FILE_URL_EXPIRATION_SECONDS = 3600 * 48
+
 
 def get_file_store_path(filename, file_metadata):
     # The file store path can depend on specific info in the filename, which is only available within
@@ -31,6 +39,63 @@ def get_file_store_path(filename, file_metadata):
     return data_file.get_filestore_path()
 
 
+def get_file_store():
+    """
+    Returns a file store client. Reuse one client when generating many URLs, like for a page of results.
+    The time spent in the client's calls is recorded in the request timings.
+    """
+    return timing.TimedFileStore(FileStoreFactory.get_file_store_class()())
+
+
+def polygon_geojson(polygon):
+    """
+    Returns the GeoJSON dict of a polygon, built straight from its coordinates instead of
+    rendering it to a GeoJSON string and parsing that
+    """
+    return {'type': 'Polygon', 'coordinates': [[list(point) for point in ring] for ring in polygon.coords]}
+
+
+def insert_or_get(obj, unique_field):
+    """
+    Insert a model instance unless a row with the same value of unique_field already exists, using a
+    single INSERT ... ON CONFLICT DO NOTHING statement which also returns the id of the existing row.
+    This avoids the race between checking for a row and inserting it. Sets the pk on the instance and
+    returns whether the row was created. The instance is not refreshed if the row already existed.
+    """
+    model = type(obj)
+    opts = model._meta
+    connection = connections[router.db_for_write(model)]
+    fields = [field for field in opts.concrete_fields if not field.primary_key]
+    query = InsertQuery(model, on_conflict=OnConflict.IGNORE)
+    query.insert_values(fields, [obj])
+    insert_sql, insert_params = query.get_compiler(connection=connection).as_sql()[0]
+
+    table = connection.ops.quote_name(opts.db_table)
+    pk_column = connection.ops.quote_name(opts.pk.column)
+    unique_column = connection.ops.quote_name(opts.get_field(unique_field).column)
+    unique_value = getattr(obj, opts.get_field(unique_field).attname)
+    select_sql = f'SELECT {pk_column}, false FROM {table} WHERE {unique_column} = %s'
+    sql = f"""
+        WITH inserted AS ({insert_sql} RETURNING {pk_column})
+        SELECT {pk_column}, true FROM inserted
+        UNION ALL
+        {select_sql}
+        LIMIT 1
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, (*insert_params, unique_value))
+        row = cursor.fetchone()
+        if row is None:
+            # The conflicting row was committed by another transaction after this statement started,
+            # so it isn't visible to the select above, but it will be to a new statement
+            cursor.execute(select_sql, [unique_value])
+            row = cursor.fetchone()
+    obj.pk, created = row
+    obj._state.adding = False
+    obj._state.db = connection.alias
+    return created
+
+
 def archived_queue_payload(validated_data: dict, frame):
     new_dictionary = validated_data.get('headers').copy()
     new_dictionary['area'] = validated_data.get('area').json if validated_data.get('area') else None
@@ -46,6 +111,24 @@ def archived_queue_payload(validated_data: dict, frame):
     return new_dictionary
 
 
+def frame_visibility_filter(user, prefix=''):
+    """
+    Returns a Q object matching the frames the user is allowed to see, or None if they can see all of
+    them. Use prefix='frame__' to filter a queryset of objects that belong to frames, like thumbnails.
+    A user's proposals are matched with a single array parameter, and the private branch is left
+    out entirely for users without any proposals so the query can use the public_date index.
+    """
+    if user.is_superuser:
+        return None
+    public = Q(**{f'{prefix}public_date__lt': datetime.datetime.now(datetime.timezone.utc)})
+    if not user.is_authenticated:
+        return public
+    proposals = user.profile.proposals
+    if not proposals:
+        return public
+    return public | Q(**{f'{prefix}proposal_id__any': proposals})
+
+
 def get_configuration_type_tuples():
     configuration_type_tuples = cache.get('configuration_type_tuples')
     if not configuration_type_tuples:
@@ -69,7 +152,7 @@ def get_configdb_data():
         if settings.CONFIGDB_URL:
             url = urljoin(settings.CONFIGDB_URL, '/instruments/')
             try:
-                response = requests.get(url)
+                response = http_client.get(url)
                 response.raise_for_status()
                 instrument_data = response.json()['results']
                 cache.set('configdb_instrument_data', instrument_data, 3600)
@@ -91,7 +174,8 @@ def post_to_archived_queue(payload):
         processed_exchange = Exchange(settings.PROCESSED_EXCHANGE_NAME, type='fanout')
         with Connection(settings.QUEUE_BROKER_URL, transport_options=retry_policy) as conn:
             producer = conn.Producer(exchange=processed_exchange)
-            producer.publish(payload, delivery_mode='persistent', retry=True, retry_policy=retry_policy)
+            with metrics.AMQP_PUBLISH_SECONDS.time():
+                producer.publish(payload, delivery_mode='persistent', retry=True, retry_policy=retry_policy)
 
 
 def build_nginx_zip_text(frames, directory, uncompress=False, catalog_only=False):
@@ -110,7 +194,7 @@ def build_nginx_zip_text(frames, directory, uncompress=False, catalog_only=False
     '''
     logger.info(msg=f'Building nginx zip text for frames {frames} with uncompress flag {uncompress}')
 
-    file_store = FileStoreFactory.get_file_store_class()()
+    file_store = get_file_store()
     ret = []
 
     for frame in frames:
@@ -136,10 +220,14 @@ def build_nginx_zip_text(frames, directory, uncompress=False, catalog_only=False
             # inefficient, but simple.
             with file_store.get_fileobj(path) as fileobj:
                 cmd = ['/usr/bin/funpack', '-C', '-S', '-', ]
+                data = fileobj.getvalue()
+                metrics.FUNPACK_BYTES.labels('in').inc(len(data))
                 try:
-                    proc = subprocess.run(cmd, input=fileobj.getvalue(), stdout=subprocess.PIPE)
+                    with metrics.FUNPACK_SECONDS.time():
+                        proc = subprocess.run(cmd, input=data, stdout=subprocess.PIPE)
                     proc.check_returncode()
                     size = len(bytes(proc.stdout))
+                    metrics.FUNPACK_BYTES.labels('out').inc(size)
                 except subprocess.CalledProcessError as cpe:
                     logger.error(f'funpack failed with return code {cpe.returncode} and error {cpe.stderr}')
                     raise FunpackError
@@ -206,7 +294,9 @@ def aggregate_frames_sql(frames, timeout=0, user_proposals=None):
     user_proposals_not_none = user_proposals is not None
     user_proposals = user_proposals if user_proposals_not_none else []
 
-    with connections["replica"].cursor() as cursor:
+    # The SET LOCALs only last until the end of the transaction, which also keeps them from leaking
+    # into other clients' queries when connecting through a transaction pooling PgBouncer
+    with transaction.atomic(using=frames.db), connections[frames.db].cursor() as cursor:
         django_sql, params = frames.query.sql_with_params()
         params = (timeout, ) + params + (user_proposals,)
         query_sql = f"""
@@ -1,34 +1,42 @@
+from archive import metrics, timing
 from archive.schema import ScienceArchiveSchema
 from archive.frames.exceptions import FunpackError
-from archive.frames.models import Frame, Thumbnail, Version
+from archive.frames.models import (
+    Frame, Thumbnail, Version, frames_as_dicts, thumbnails_as_dicts, frame_only_fields, frames_include_urls,
+    FRAME_FIELDS, FRAME_VERSION_FIELDS, FRAME_LEGACY_FIELDS, with_area_geojson
+)
 from archive.frames.serializers import (
     AggregateSerializer, FrameSerializer, ThumbnailSerializer, ZipSerializer, VersionSerializer,
-    HeadersSerializer, AggregateQueryParamsSeralizer,
+    HeadersSerializer, AggregateQueryParamsSeralizer, ThumbnailLookupSerializer, FrameExportQueryParamsSerializer,
 )
 from archive.frames.utils import (
-    build_nginx_zip_text, get_file_store_path,
-    aggregate_frames_sql, get_cached_frames_aggregates
+    build_nginx_zip_text, get_file_store_path, get_file_store,
+    aggregate_frames_sql, get_cached_frames_aggregates, frame_visibility_filter
 
 )
 from archive.frames.permissions import AdminOrReadOnly
 from archive.frames.filters import FrameFilter, ThumbnailFilter
+from archive.frames.export import FrameExporter, EXPORT_FORMATS
+from archive.frames.conditional import (
+    conditional_response, set_validators, make_etag, frame_last_modified, frames_last_modified, url_window_start
+)
 
 from archive.doc_examples import EXAMPLE_RESPONSES, QUERY_PARAMETERS
-from archive.frames.pagination import LimitedLimitOffsetPagination, CustomCursorPagination
+from archive.frames.pagination import LimitedLimitOffsetPagination, CustomCursorPagination, is_small_frame_query
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAdminUser
 from rest_framework import status, filters, viewsets
 from rest_framework.authtoken.models import Token
-from rest_framework.exceptions import APIException
+from rest_framework.exceptions import APIException, ValidationError
 from django_filters.rest_framework import DjangoFilterBackend
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 from django.db.models import Q, Prefetch, Count
 from django.views.decorators.clickjacking import xframe_options_exempt
 from django.shortcuts import get_object_or_404
 from django.core.cache import cache
 from django.conf import settings
-from django.db import OperationalError
+from django.db import OperationalError, transaction
 from django.db.models.functions import Now
 from django.utils.cache import patch_response_headers
 from django.views.decorators.vary import vary_on_headers
@@ -38,9 +46,9 @@ from hashlib import blake2b
 import subprocess
 import datetime
 import logging
+import time
 import io
 
-from ocs_archive.storage.filestorefactory import FileStoreFactory
 from ocs_authentication.auth_profile.models import AuthProfile
 
 logger = logging.getLogger()
@@ -80,6 +88,17 @@ class FrameViewSet(SelectablePaginationMixin, viewsets.ModelViewSet):
     ordering_fields = ('id', 'basename', 'observation_date', 'primary_optical_element', 'configuration_type',
                        'proposal_id', 'instrument_id', 'target_name', 'reduction_level', 'exposure_time')
     ordering = ['-observation_date']
+    timed_actions = ('list', 'retrieve', 'create', 'zip', 'aggregate')
+
+    def initial(self, request, *args, **kwargs):
+        self.started = time.perf_counter()
+        super().initial(request, *args, **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if self.action in self.timed_actions and hasattr(self, 'started'):
+            metrics.FRAME_REQUEST_SECONDS.labels(self.action).observe(time.perf_counter() - self.started)
+        return response
 
     def get_queryset(self):
         """
@@ -89,26 +108,72 @@ class FrameViewSet(SelectablePaginationMixin, viewsets.ModelViewSet):
         all frames that belong to their proposals.
         Non authenticated see all frames with a PUBDAT in the past
         """
-        queryset = (
-            Frame.objects.exclude(observation_date=None)
-            .prefetch_related('version_set')
-            .prefetch_related('thumbnails')
-        )
-        if self.action == 'list':
+        fields = self.get_fields()
+        queryset = Frame.objects.exclude(observation_date=None)
+        if fields is not None:
+            queryset = queryset.only(*frame_only_fields(fields))
+        if self.action in ('list', 'retrieve') and (fields is None or 'area' in fields):
+            queryset = with_area_geojson(queryset)
+        # Exports only fetch versions for the columns that need them
+        if self.action != 'export' and (fields is None or fields & set(FRAME_VERSION_FIELDS)):
+            queryset = queryset.prefetch_related('version_set')
+        if self.action in ('list', 'export'):
             # Exclude frames without a version in list searches
             queryset = queryset.exclude(version__isnull=True)
+        # Only prefetch thumbnails, of the requested sizes, if we're including them in the response
+        if (self.action != 'export' and self.request.query_params.get('include_thumbnails', '').lower() == 'true'
+                and (fields is None or 'thumbnails' in fields)):
+            thumbnails = Thumbnail.objects.all()
+            thumbnail_sizes = [size for size in self.request.query_params.get('thumbnail_sizes', '').split(',') if size]
+            if thumbnail_sizes:
+                thumbnails = thumbnails.filter(size__in=thumbnail_sizes)
+            queryset = queryset.prefetch_related(Prefetch('thumbnails', queryset=thumbnails))
         # Only prefetch related frames if we're including them in the response
-        if self.request.query_params.get('include_related_frames', '').lower() != 'false':
+        if (self.action != 'export' and self.request.query_params.get('include_related_frames', '').lower() != 'false'
+                and (fields is None or 'related_frames' in fields)):
             queryset = queryset.prefetch_related(Prefetch('related_frames', queryset=Frame.objects.all().only('id')))
-        if self.request.user.is_superuser:
+        visibility = frame_visibility_filter(self.request.user)
+        if visibility is None:
             return queryset
-        elif self.request.user.is_authenticated:
-            return queryset.filter(
-                Q(proposal_id__in=self.request.user.profile.proposals) |
-                Q(public_date__lt=datetime.datetime.now(datetime.timezone.utc))
-            )
-        else:
-            return queryset.filter(public_date__lt=datetime.datetime.now(datetime.timezone.utc))
+        return queryset.filter(visibility)
+
+    def get_fields(self):
+        """
+        Returns the set of fields chosen for the list and detail responses with the comma separated fields
+        and omit query parameters, or None if all fields should be returned. The legacy uppercase field
+        names are left out with include_legacy_fields=false.
+        """
+        if self.action not in ('list', 'retrieve'):
+            return None
+        if not hasattr(self, '_fields'):
+            requested = {
+                name: [field.strip() for field in self.request.query_params.get(name, '').split(',') if field.strip()]
+                for name in ('fields', 'omit')
+            }
+            unknown_fields = [field for field in requested['fields'] + requested['omit'] if field not in FRAME_FIELDS]
+            if unknown_fields:
+                raise ValidationError({'fields': 'Unknown fields: {}'.format(', '.join(unknown_fields))})
+            if self.request.query_params.get('include_legacy_fields', '').lower() == 'false':
+                requested['omit'].extend(FRAME_LEGACY_FIELDS)
+            if not requested['fields'] and not requested['omit']:
+                self._fields = None
+            else:
+                self._fields = set(requested['fields'] or FRAME_FIELDS) - set(requested['omit'])
+                # The id is always returned, so that frames can be told apart
+                self._fields.add('id')
+        return self._fields
+
+    def get_validators(self, last_modified, *parts):
+        """
+        Returns the ETag and Last-Modified validators of a frame response. The ETag also depends on the
+        query parameters, which change the representation, and on when the URLs in the response were signed.
+        """
+        include_thumbnails = self.request.query_params.get('include_thumbnails', '').lower() == 'true'
+        if self.action in ('list', 'retrieve') and frames_include_urls(include_thumbnails, self.get_fields()):
+            window_start = url_window_start()
+            last_modified = max(last_modified, window_start) if last_modified is not None else window_start
+        query_params = sorted((key, values) for key, values in self.request.query_params.lists())
+        return make_etag(self.action, last_modified, query_params, *parts), last_modified
 
     # These two method overrides just force the use of the as_dict method for serialization for list and detail endpoints
     def list(self, request, *args, **kwargs):
@@ -119,20 +184,45 @@ class FrameViewSet(SelectablePaginationMixin, viewsets.ModelViewSet):
         include_thumbnails = True if request.query_params.get('include_thumbnails', '').lower() == 'true' else False
 
         queryset = self.filter_queryset(self.get_queryset())
+        # Pipelines poll small queries such as ?request_id= for new frames, so those can be revalidated
+        # without serializing the page. The validators are found with the count of the frames, which is
+        # reused for the page, so they don't add a query.
+        validators = None
+        if is_small_frame_query(request.query_params):
+            frames_state = frames_last_modified(queryset)
+            if frames_state is not None:
+                last_modified, count = frames_state
+                self.paginator.known_count = count
+                # Which frames are in the set depends on what the user is allowed to see
+                validators = self.get_validators(last_modified, count, request.user.pk)
+                not_modified = conditional_response(request, *validators)
+                if not_modified is not None:
+                    return not_modified
+
         page = self.paginate_queryset(queryset)
         if page is not None:
-            json_models = [model.as_dict(include_thumbnails, include_related_frames) for model in page]
-            return self.get_paginated_response(json_models)
+            with timing.timed('serialize'):
+                data = frames_as_dicts(page, include_thumbnails, include_related_frames, self.get_fields())
+            response = self.get_paginated_response(data)
         else:
-            return Response(self.get_serializer(queryset, many=True).data)
+            response = Response(self.get_serializer(queryset, many=True).data)
+        if validators is not None:
+            set_validators(response, *validators)
+        return response
 
     def retrieve(self, request, *args, **kwargs):
         instance = self.get_object()
+        validators = self.get_validators(frame_last_modified(instance), instance.id)
+        not_modified = conditional_response(request, *validators)
+        if not_modified is not None:
+            return not_modified
         include_thumbnails = True if request.query_params.get('include_thumbnails', '').lower() == 'true' else False
         include_related_frames = True
         if request.query_params.get('include_related_frames', '').lower() == 'false':
             include_related_frames = False
-        return Response(instance.as_dict(include_thumbnails, include_related_frames))
+        with timing.timed('serialize'):
+            data = instance.as_dict(include_thumbnails, include_related_frames, fields=self.get_fields())
+        return set_validators(Response(data), *validators)
 
     def create(self, request):
         basename = request.data.get('basename')
@@ -175,8 +265,12 @@ class FrameViewSet(SelectablePaginationMixin, viewsets.ModelViewSet):
         Return the metadata (headers) associated with the archive record
         """
         frame = self.get_object()
+        validators = self.get_validators(frame_last_modified(frame), frame.id)
+        not_modified = conditional_response(request, *validators)
+        if not_modified is not None:
+            return not_modified
         response_serializer = self.get_response_serializer(frame.headers)
-        return Response(response_serializer.data)
+        return set_validators(Response(response_serializer.data), *validators)
 
     @xframe_options_exempt
     @action(detail=False, methods=['post'], permission_classes=[AllowAny])
@@ -210,6 +304,28 @@ class FrameViewSet(SelectablePaginationMixin, viewsets.ModelViewSet):
             return response
         return Response(request_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=False)
+    def export(self, request):
+        """
+        Stream the metadata of every frame matching the same filters as the frames list, as NDJSON, CSV,
+        an Arrow IPC stream or Parquet. The columns to export can be chosen with a comma separated list of
+        columns, and signed download URLs for the latest version of each frame are included in NDJSON and
+        CSV exports with include_urls=true.
+        """
+        qp = FrameExportQueryParamsSerializer(data=request.query_params)
+        qp.is_valid(raise_exception=True)
+        query_params = qp.validated_data
+
+        export_format = query_params['export_format']
+        exporter = FrameExporter(
+            self.filter_queryset(self.get_queryset()), query_params['columns'],
+            include_urls=query_params['include_urls'], chunk_size=settings.FRAME_EXPORT_CHUNK_SIZE
+        )
+        response = StreamingHttpResponse(exporter.stream(export_format), content_type=EXPORT_FORMATS[export_format])
+        response['Content-Disposition'] = 'attachment; filename=frames-{0}.{1}'.format(
+            datetime.date.strftime(datetime.date.today(), '%Y%m%d'), export_format
+        )
+        return response
 
     @vary_on_headers("Cookie", "Authorization")
     @action(detail=False)
@@ -335,11 +451,13 @@ class FrameViewSet(SelectablePaginationMixin, viewsets.ModelViewSet):
 
             if public_agg is None:
                 logger.info("public agg cache miss")
+                metrics.AGGREGATE_CACHE.labels('public', 'miss').inc()
                 public_frames = frames.all().filter(public_date__lte=Now())
                 public_agg = self._agg_frames_sql(public_frames, query_timeout)
                 cache.set(public_cache_key, public_agg, public_cache_timeout)
             else:
                 logger.info("public agg cache hit")
+                metrics.AGGREGATE_CACHE.labels('public', 'hit').inc()
         else:
             # doesn't actually do a query
             public_agg = self._agg_frames_sql(frames.none(), public_cache_timeout)
@@ -362,6 +480,7 @@ class FrameViewSet(SelectablePaginationMixin, viewsets.ModelViewSet):
 
         if private_agg is None:
             logger.info("private agg cache miss")
+            metrics.AGGREGATE_CACHE.labels('private', 'miss').inc()
             private_frames = frames.all().filter(public_date__gt=Now())
 
             user_proposals = None
@@ -376,6 +495,7 @@ class FrameViewSet(SelectablePaginationMixin, viewsets.ModelViewSet):
             cache.set(private_cache_key, private_agg, private_cache_timeout)
         else:
             logger.info("private agg cache hit")
+            metrics.AGGREGATE_CACHE.labels('private', 'hit').inc()
 
         union_agg = {}
         for k, v in public_agg.items():
@@ -411,6 +531,7 @@ class FrameViewSet(SelectablePaginationMixin, viewsets.ModelViewSet):
         logger.info("returning all aggregates from cache")
 
         response_dict = get_cached_frames_aggregates()
+        metrics.AGGREGATE_CACHE.labels('all', 'hit' if response_dict else 'miss').inc()
 
         if not response_dict:
             logger.warn(
@@ -445,12 +566,14 @@ class FrameViewSet(SelectablePaginationMixin, viewsets.ModelViewSet):
         return example_responses.get(self.action)
 
     def get_query_parameters(self):
-        query_parameters = {'aggregate': QUERY_PARAMETERS['frames']['aggregate']}
+        query_parameters = {'aggregate': QUERY_PARAMETERS['frames']['aggregate'],
+                            'export': QUERY_PARAMETERS['frames']['export']}
 
         return query_parameters.get(self.action)
 
     def get_endpoint_name(self):
         endpoint_names = {'aggregate': 'aggregateFields',
+                          'export': 'exportFrames',
                           'headers': 'getHeaders',
                           'related': 'getRelatedFrames',
                           'zip': 'getZipArchive'}
@@ -477,30 +600,71 @@ class ThumbnailViewSet(viewsets.ModelViewSet):
         queryset = (
             Thumbnail.objects.all().select_related('frame')
         )
-        if self.request.user.is_superuser:
+        visibility = frame_visibility_filter(self.request.user, prefix='frame__')
+        if visibility is None:
             return queryset
-        elif self.request.user.is_authenticated:
-            return queryset.filter(
-                Q(frame__proposal_id__in=self.request.user.profile.proposals) |
-                Q(frame__public_date__lt=datetime.datetime.now(datetime.timezone.utc))
-            )
-        else:
-            return queryset.filter(frame__public_date__lt=datetime.datetime.now(datetime.timezone.utc))
+        return queryset.filter(visibility)
 
     # These two method overrides just force the use of the as_dict method for serialization for list and detail endpoints
     def list(self, request, *args, **kwargs):
         queryset = self.filter_queryset(self.get_queryset())
         page = self.paginate_queryset(queryset)
         if page is not None:
-            json_models = [model.as_dict() for model in page]
-            return self.get_paginated_response(json_models)
+            with timing.timed('serialize'):
+                data = thumbnails_as_dicts(page)
+            return self.get_paginated_response(data)
         return Response(self.get_serializer(queryset, many=True).data)
 
-
     def retrieve(self, request, *args, **kwargs):
         instance = self.get_object()
         return Response(instance.as_dict())
 
+    @action(detail=False, methods=['post'], permission_classes=[AllowAny])
+    def lookup(self, request):
+        """
+        Return the thumbnails for many frames at once, specified by frame basename or observation ID.
+        Results are grouped by frame basename and then thumbnail size.
+        """
+        request_serializer = ThumbnailLookupSerializer(data=request.data)
+        if not request_serializer.is_valid():
+            return Response(request_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        frames = Q()
+        if request_serializer.validated_data.get('frame_basenames'):
+            frames |= Q(frame__basename__any=request_serializer.validated_data['frame_basenames'])
+        if request_serializer.validated_data.get('observation_ids'):
+            frames |= Q(frame__observation_id__in=request_serializer.validated_data['observation_ids'])
+        thumbnails = self.get_queryset().filter(frames)
+        if request_serializer.validated_data.get('sizes'):
+            thumbnails = thumbnails.filter(size__in=request_serializer.validated_data['sizes'])
+        # Order by id so the most recently ingested thumbnail of a size wins if a frame has more than one
+        thumbnails = list(thumbnails.order_by('id'))
+        results = {}
+        for thumbnail, thumbnail_dict in zip(thumbnails, thumbnails_as_dicts(thumbnails)):
+            results.setdefault(thumbnail.frame.basename, {})[thumbnail.size] = thumbnail_dict
+        return Response({'results': results})
+
+    def validate_thumbnail(self, data, logger_tags):
+        """
+        Validate a thumbnail payload, along with the metadata for the frame it belongs to. Returns the frame
+        and thumbnail serializers, or the validation errors.
+        """
+        # Make sure we have the minimum information to make a frame object associated with the thumbnail if one doesn't already exist
+        frame_serializer = FrameSerializer(data=data)
+        if not frame_serializer.is_valid():
+            logger_tags['tags']['errors'] = frame_serializer.errors
+            logger.fatal('Request to process thumbnail failed when serializing frame metadata', extra=logger_tags)
+            return None, None, frame_serializer.errors
+        # The ingester sends the key/extension in the version_set, but we don't keep versions of thumbnails, so just store the key/extension in the thumbnail
+        data['key'] = data['version_set'][0]['key']
+        data['extension'] = data['version_set'][0]['extension']
+
+        thumbnail_serializer = ThumbnailSerializer(data=data)
+        if not thumbnail_serializer.is_valid():
+            logger_tags['tags']['errors'] = thumbnail_serializer.errors
+            logger.fatal('Request to process thumbnail failed', extra=logger_tags)
+            return None, None, thumbnail_serializer.errors
+        return frame_serializer, thumbnail_serializer, None
+
     def create(self, request):
         basename = request.data.get('basename')
         logger_tags = {'tags': {
@@ -508,36 +672,61 @@ class ThumbnailViewSet(viewsets.ModelViewSet):
             'request_id': request.data.get('request_id')
         }}
         logger.info('Got request to process thumbnail', extra=logger_tags)
-        # Make sure we have the minimum information to make a frame object associated with the thumbnail if one doesn't already exist
-        frame_serializer = FrameSerializer(data=request.data)
-        if frame_serializer.is_valid():
-            # The ingester sends the key/extension in the version_set, but we don't keep versions of thumbnails, so just store the key/extension in the thumbnail
-            request.data['key'] = request.data['version_set'][0]['key']
-            request.data['extension'] = request.data['version_set'][0]['extension']
-        else:
-            logger_tags['tags']['errors'] = frame_serializer.errors
-            logger.fatal('Request to process thumbnail failed when serializing frame metadata', extra=logger_tags)
-            return Response(frame_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        frame_serializer, thumbnail_serializer, errors = self.validate_thumbnail(request.data, logger_tags)
+        if errors:
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        # Create the frame if it doesn't exist yet. The version set is not passed on, as this version
+        # does not correspond to the frame object, but rather the thumbnail.
+        frame, _ = frame_serializer.get_or_create(basename=request.data['frame_basename'])
+        thumbnail = ThumbnailSerializer.upsert([{**thumbnail_serializer.validated_data, 'frame_id': frame.id}])[0]
+        logger_tags['tags']['id'] = thumbnail.id
+        logger.info('Created thumbnail', extra=logger_tags)
+        logger.info('Request to process thumbnail succeeded', extra=logger_tags)
+        return Response(ThumbnailSerializer(thumbnail).data, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Create or update a list of thumbnails, such as the small, medium and large thumbnails of a frame,
+        in one request. Nothing is saved if any of the thumbnails are invalid.
 
-        thumbnail_serializer = ThumbnailSerializer(data=request.data)
-        if thumbnail_serializer.is_valid():
-            # Remove the version set as this version does not correspond to the frame object, but rather the thumbnail.
-            del frame_serializer.validated_data['version_set']
-
-            # Check if the frame already exists by basename, if not, create it.
-            frame = Frame.objects.filter(basename=request.data['frame_basename']).first()
-            if frame is None:
-                frame = frame_serializer.save(basename=request.data['frame_basename'])
-
-            thumbnail = thumbnail_serializer.save(frame=frame)
-            logger_tags['tags']['id'] = thumbnail.id
-            logger.info('Created thumbnail', extra=logger_tags)
-            logger.info('Request to process thumbnail succeeded', extra=logger_tags)
-            return Response(thumbnail_serializer.data, status=status.HTTP_201_CREATED)
-        else:
-            logger_tags['tags']['errors'] = thumbnail_serializer.errors
-            logger.fatal('Request to process thumbnail failed', extra=logger_tags)
-            return Response(thumbnail_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        Unlike creating a single thumbnail, which returns the thumbnail with its frame and download URL,
+        this returns only the id, frame id, basename and size of each thumbnail, so that ingesting many
+        thumbnails doesn't serialize their frames and sign their URLs.
+        """
+        if not isinstance(request.data, list) or not all(isinstance(data, dict) for data in request.data):
+            return Response(
+                {'non_field_errors': ['Expected a list of thumbnail objects']}, status=status.HTTP_400_BAD_REQUEST
+            )
+        logger_tags = {'tags': {
+            'filenames': [data.get('basename') for data in request.data],
+            'request_id': request.data[0].get('request_id') if request.data else None
+        }}
+        logger.info('Got request to process thumbnails', extra=logger_tags)
+        validated = []
+        for data in request.data:
+            frame_serializer, thumbnail_serializer, errors = self.validate_thumbnail(data, logger_tags)
+            if errors:
+                return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+            validated.append((data['frame_basename'], frame_serializer, thumbnail_serializer))
+
+        frame_ids = {}
+        thumbnails_data = []
+        with transaction.atomic():
+            for frame_basename, frame_serializer, thumbnail_serializer in validated:
+                if frame_basename not in frame_ids:
+                    frame, _ = frame_serializer.get_or_create(basename=frame_basename)
+                    frame_ids[frame_basename] = frame.id
+                thumbnails_data.append({**thumbnail_serializer.validated_data, 'frame_id': frame_ids[frame_basename]})
+            thumbnails = ThumbnailSerializer.upsert(thumbnails_data)
+        logger_tags['tags']['ids'] = [thumbnail.id for thumbnail in thumbnails]
+        logger.info('Request to process thumbnails succeeded', extra=logger_tags)
+        return Response(
+            [{'id': thumbnail.id, 'frame': thumbnail.frame_id, 'basename': thumbnail.basename, 'size': thumbnail.size}
+             for thumbnail in thumbnails],
+            status=status.HTTP_201_CREATED
+        )
 
 
 class VersionViewSet(viewsets.ReadOnlyModelViewSet):
@@ -570,20 +759,24 @@ class FunpackViewSet(viewsets.ViewSet):
 
         frame = get_object_or_404(Frame, pk=pk)
         version = frame.version_set.first()
-        file_store = FileStoreFactory.get_file_store_class()()
+        file_store = get_file_store()
         path = get_file_store_path(version.frame.filename, version.frame.get_header_dict())
 
         with file_store.get_fileobj(path) as fileobj:
             # FITS unpack
             cmd = ['/usr/bin/funpack', '-C', '-S', '-', ]
+            data = fileobj.getvalue()
+            metrics.FUNPACK_BYTES.labels('in').inc(len(data))
             try:
-                proc = subprocess.run(cmd, input=fileobj.getvalue(), stdout=subprocess.PIPE)
+                with metrics.FUNPACK_SECONDS.time():
+                    proc = subprocess.run(cmd, input=data, stdout=subprocess.PIPE)
                 proc.check_returncode()
             except subprocess.CalledProcessError as cpe:
                 logger.error(f'funpack failed with return code {cpe.returncode} and error {cpe.stderr}')
                 raise FunpackError
 
             # return it to the client
+            metrics.FUNPACK_BYTES.labels('out').inc(len(proc.stdout))
             return HttpResponse(bytes(proc.stdout), content_type='application/octet-stream')
 
     def get_example_response(self):
@@ -611,7 +804,7 @@ class CatalogViewSet(viewsets.ViewSet):
 
         frame = get_object_or_404(Frame, pk=pk)
         version = frame.version_set.first()
-        file_store = FileStoreFactory.get_file_store_class()()
+        file_store = get_file_store()
         path = get_file_store_path(version.frame.filename, version.frame.get_header_dict())
 
         filename = frame.filename.replace('.fits.fz', '-catalog.fits')
@@ -0,0 +1,163 @@
+"""
+Probes of the services the archive depends on, for the deep health check.
+
+Every probe runs in its own thread, so the check takes as long as the slowest probe rather than the sum of
+them, and the check gives up on probes that take longer than HEALTH_CHECK_TIMEOUT_SECONDS. Database probes
+also set a statement timeout, and use their own connection, which is closed afterwards.
+
+A probe reports ok, degraded or error, with its latency in milliseconds. The archive keeps working without
+a replica, the cache or the broker, so failures of those only degrade the check. Failures of the primary
+database or the file store fail it.
+
+The check is unauthenticated, so that load balancers can poll it, and it is cheap to call however often
+it is called: the result is cached in process for HEALTH_CHECK_CACHE_SECONDS, concurrent calls wait for
+the same check, and a probe that is still stuck from an earlier check is not started again.
+"""
+from concurrent.futures import ThreadPoolExecutor, wait
+import threading
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+from kombu.connection import Connection
+
+from archive.frames.models import Version
+from archive.frames.utils import get_file_store, get_file_store_path
+from archive.replication import REPLICA_STATE_SQL
+
+logger = logging.getLogger()
+
+OK = 'ok'
+DEGRADED = 'degraded'
+ERROR = 'error'
+DISABLED = 'disabled'
+
+_lock = threading.Lock()
+_last_check = None
+_running = {}
+
+
+def probe_database(alias):
+    """
+    Runs a trivial query on the database, or measures the replication lag of a replica
+    """
+    connection = connections[alias]
+    try:
+        with transaction.atomic(using=alias), connection.cursor() as cursor:
+            cursor.execute(f'SET LOCAL statement_timeout TO {int(settings.HEALTH_CHECK_TIMEOUT_SECONDS * 1000)};')
+            if alias not in settings.REPLICA_DATABASES:
+                cursor.execute('SELECT 1')
+                cursor.fetchone()
+                return {}
+            cursor.execute(REPLICA_STATE_SQL)
+            lag = float(cursor.fetchone()[0])
+    finally:
+        connection.close()
+    result = {'lag_seconds': lag}
+    if lag > settings.REPLICA_MAX_LAG_SECONDS:
+        result['status'] = DEGRADED
+    return result
+
+
+def probe_cache():
+    value = str(time.time())
+    cache.set('health_check', value, 10)
+    if cache.get('health_check') != value:
+        return {'status': DEGRADED}
+    return {}
+
+
+def probe_broker():
+    if not settings.PROCESSED_EXCHANGE_ENABLED:
+        return {'status': DISABLED}
+    with Connection(settings.QUEUE_BROKER_URL, connect_timeout=settings.HEALTH_CHECK_TIMEOUT_SECONDS) as conn:
+        conn.ensure_connection(max_retries=1)
+    return {}
+
+
+def probe_file_store():
+    """
+    Gets the size of the newest file in the file store, which reads its metadata without downloading it
+    """
+    try:
+        version = Version.objects.using('default').select_related('frame').order_by('-id').first()
+    finally:
+        connections['default'].close()
+    if version is None:
+        return {'status': DISABLED}
+    filename = '{0}{1}'.format(version.frame.basename, version.extension)
+    get_file_store().get_file_size(get_file_store_path(filename, version.frame.get_header_dict()))
+    return {}
+
+
+def get_probes():
+    """
+    Returns the probes to run by name, with whether the archive fails without the service
+    """
+    probes = {'database_default': (lambda: probe_database('default'), True)}
+    for alias in settings.REPLICA_DATABASES:
+        probes['database_{}'.format(alias)] = (lambda alias=alias: probe_database(alias), False)
+    probes['cache'] = (probe_cache, False)
+    probes['broker'] = (probe_broker, False)
+    probes['file_store'] = (probe_file_store, True)
+    return probes
+
+
+def run_probe(probe):
+    start = time.perf_counter()
+    try:
+        result = {'status': OK, **probe()}
+    except Exception as e:
+        logger.warning('Health check probe failed: {}'.format(repr(e)))
+        # Only the type of the error is reported, so that no connection details are exposed
+        result = {'status': ERROR, 'error': type(e).__name__}
+    result['latency_ms'] = round((time.perf_counter() - start) * 1000, 3)
+    return result
+
+
+def check_health():
+    """
+    Returns the overall status and the result of each probe, from the cache if the last check is recent enough
+    """
+    global _last_check
+    with _lock:
+        if _last_check is not None and time.monotonic() < _last_check[0]:
+            return _last_check[1]
+        result = run_probes()
+        _last_check = (time.monotonic() + settings.HEALTH_CHECK_CACHE_SECONDS, result)
+        return result
+
+
+def run_probes():
+    """
+    Runs all of the probes at once. Returns the overall status and the result of each probe.
+    """
+    probes = get_probes()
+    executor = ThreadPoolExecutor(max_workers=len(probes))
+    futures = {}
+    for name, (probe, _) in probes.items():
+        # Wait on a probe that is still stuck from an earlier check rather than starting another one
+        running = _running.get(name)
+        futures[name] = running if running is not None and not running.done() else executor.submit(run_probe, probe)
+    _running.update(futures)
+    wait(futures.values(), timeout=settings.HEALTH_CHECK_TIMEOUT_SECONDS)
+    # Don't wait for probes that are stuck, they are reported as timed out
+    executor.shutdown(wait=False, cancel_futures=True)
+
+    results = {}
+    status = OK
+    for name, future in futures.items():
+        if future.done() and not future.cancelled():
+            results[name] = future.result()
+        else:
+            results[name] = {'status': ERROR, 'error': 'timeout'}
+        probe_status = results[name]['status']
+        if probe_status in (ERROR, DEGRADED):
+            critical = probes[name][1]
+            if critical and probe_status == ERROR:
+                status = ERROR
+            elif status == OK:
+                status = DEGRADED
+    return status, results
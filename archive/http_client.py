@@ -0,0 +1,125 @@
+"""
+Shared HTTP client for calls to other OCS services (the oauth server and configdb).
+Connections are pooled per worker process, every call has a timeout, and hosts that keep
+failing are short circuited. Under the gevent workers these calls yield to other greenlets.
+"""
+from urllib.parse import urlsplit
+import threading
+import logging
+import time
+
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+import requests
+
+logger = logging.getLogger()
+
+_session = None
+_circuit_breaker = None
+_lock = threading.Lock()
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """
+    Raised instead of making a request to a host that has failed too many times in a row.
+    This subclasses ConnectionError so existing handling of unreachable services applies to it.
+    """
+
+
+class CircuitBreaker:
+    """
+    Tracks consecutive connection failures per host. Once a host reaches the failure threshold,
+    requests to it fail immediately until reset_seconds have passed, after which a single trial
+    request is let through to check whether the host has recovered.
+    """
+    def __init__(self, failure_threshold, reset_seconds):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._failures = {}
+        self._opened_at = {}
+        self._lock = threading.Lock()
+
+    def before_request(self, host):
+        with self._lock:
+            opened_at = self._opened_at.get(host)
+            if opened_at is None:
+                return
+            if time.monotonic() - opened_at < self.reset_seconds:
+                raise CircuitOpenError(f'Requests to {host} are suspended after repeated failures')
+            # Let this request through as a trial, and keep blocking others until it completes
+            self._opened_at[host] = time.monotonic()
+
+    def record_success(self, host):
+        with self._lock:
+            self._failures.pop(host, None)
+            self._opened_at.pop(host, None)
+
+    def record_failure(self, host):
+        with self._lock:
+            failures = self._failures.get(host, 0) + 1
+            self._failures[host] = failures
+            if failures >= self.failure_threshold:
+                if host not in self._opened_at:
+                    logger.warning(
+                        'Suspending requests after repeated failures',
+                        extra={'tags': {'host': host, 'failures': failures}}
+                    )
+                self._opened_at[host] = time.monotonic()
+
+    def is_open(self, host):
+        with self._lock:
+            return host in self._opened_at
+
+
+def get_session():
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=settings.HTTP_CLIENT_POOL_SIZE,
+                    pool_maxsize=settings.HTTP_CLIENT_POOL_SIZE
+                )
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _session = session
+    return _session
+
+
+def get_circuit_breaker():
+    global _circuit_breaker
+    if _circuit_breaker is None:
+        with _lock:
+            if _circuit_breaker is None:
+                _circuit_breaker = CircuitBreaker(
+                    settings.HTTP_CLIENT_CIRCUIT_BREAKER_THRESHOLD,
+                    settings.HTTP_CLIENT_CIRCUIT_BREAKER_RESET_SECONDS
+                )
+    return _circuit_breaker
+
+
+def request(method, url, timeout=None, **kwargs):
+    """
+    Make a request using the shared session. The timeout defaults to the configured
+    (connect, read) timeouts. Raises CircuitOpenError if the host has been failing.
+    """
+    if timeout is None:
+        timeout = (settings.HTTP_CLIENT_CONNECT_TIMEOUT_SECONDS, settings.HTTP_CLIENT_READ_TIMEOUT_SECONDS)
+    host = urlsplit(url).netloc
+    circuit_breaker = get_circuit_breaker()
+    circuit_breaker.before_request(host)
+    try:
+        response = get_session().request(method, url, timeout=timeout, **kwargs)
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+        circuit_breaker.record_failure(host)
+        raise
+    if response.status_code >= 500:
+        circuit_breaker.record_failure(host)
+    else:
+        circuit_breaker.record_success(host)
+    return response
+
+
+def get(url, timeout=None, **kwargs):
+    return request('GET', url, timeout=timeout, **kwargs)
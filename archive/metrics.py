@@ -0,0 +1,89 @@
+"""
+Prometheus metrics for the hot paths of the archive, served at /metrics/.
+
+Needs the optional prometheus_client package. Without it, the metrics do nothing and /metrics/ returns a 404.
+/metrics/ is only served when METRICS_ENABLED is set, and requires METRICS_TOKEN as a bearer token if one is set.
+With several gunicorn workers, set PROMETHEUS_MULTIPROC_DIR to an empty directory that all of them can write
+to, so that /metrics/ reports the metrics of every worker rather than only of the one that served the scrape.
+gunicorn.conf.py clears the directory when gunicorn starts and cleans up after workers that exit.
+"""
+from contextlib import nullcontext
+import hmac
+import os
+
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+
+try:
+    import prometheus_client
+    from prometheus_client import multiprocess
+except ImportError:
+    prometheus_client = None
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class NoopMetric:
+    """
+    Stands in for a metric when prometheus_client isn't installed
+    """
+    def labels(self, *args, **kwargs):
+        return self
+
+    def observe(self, amount):
+        pass
+
+    def inc(self, amount=1):
+        pass
+
+    def time(self):
+        return nullcontext()
+
+
+def metrics_available():
+    return prometheus_client is not None
+
+
+def histogram(name, documentation, labelnames=(), buckets=DURATION_BUCKETS):
+    if prometheus_client is None:
+        return NoopMetric()
+    return prometheus_client.Histogram(name, documentation, labelnames, buckets=buckets)
+
+
+def counter(name, documentation, labelnames=()):
+    if prometheus_client is None:
+        return NoopMetric()
+    return prometheus_client.Counter(name, documentation, labelnames)
+
+
+FRAME_REQUEST_SECONDS = histogram(
+    'archive_frame_request_seconds', 'Time taken by the frame endpoints, excluding rendering', ['action']
+)
+COUNT_OUTCOMES = counter(
+    'archive_count_outcomes', 'How the counts of paginated results were found: exact, estimate, timeout or failed',
+    ['outcome']
+)
+AGGREGATE_CACHE = counter(
+    'archive_aggregate_cache', 'Lookups of cached frame aggregates', ['cache', 'result']
+)
+FUNPACK_SECONDS = histogram('archive_funpack_seconds', 'Time taken by the funpack subprocess')
+FUNPACK_BYTES = counter('archive_funpack_bytes', 'Bytes passed through funpack', ['direction'])
+AMQP_PUBLISH_SECONDS = histogram(
+    'archive_amqp_publish_seconds', 'Time taken to publish a message to the processed exchange'
+)
+AUTH_CACHE = counter('archive_auth_cache', 'Lookups of cached authentication data', ['cache', 'result'])
+
+
+def metrics_view(request):
+    if prometheus_client is None or not settings.METRICS_ENABLED:
+        raise Http404('Metrics are not enabled')
+    if settings.METRICS_TOKEN:
+        expected = 'Bearer {}'.format(settings.METRICS_TOKEN)
+        if not hmac.compare_digest(request.headers.get('Authorization', '').encode(), expected.encode()):
+            return HttpResponseForbidden()
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registry = prometheus_client.CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prometheus_client.REGISTRY
+    return HttpResponse(prometheus_client.generate_latest(registry), content_type=prometheus_client.CONTENT_TYPE_LATEST)
@@ -0,0 +1,174 @@
+from contextlib import ExitStack
+from hashlib import blake2b
+import logging
+import re
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.utils.cache import patch_vary_headers
+
+from archive import compression, replication, timing
+
+logger = logging.getLogger()
+
+READ_AFTER_HEADER = 'X-Archive-Read-After'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# Statements that write to the frames tables, which are the only ones read from the replicas
+FRAMES_WRITE = re.compile(r'^\s*(?:WITH\b.*?\b)?(?:INSERT\s+INTO|UPDATE|DELETE\s+FROM)\s+"?frames_', re.I | re.S)
+
+
+def read_after_cache_key(request):
+    """
+    Identify the client by its credentials, so that its writes can be tracked without any changes to the
+    client. Returns None for anonymous requests.
+    """
+    credentials = request.headers.get('Authorization') or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if not credentials:
+        return None
+    return 'read_after_{}'.format(blake2b(credentials.encode('utf-8'), digest_size=32).hexdigest())
+
+
+class PinReplicaMiddleware:
+    """
+    Sends all of the reads of a request that go to a replica to the same one, so that a request never
+    combines the results of replicas that are behind the primary by different amounts
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = replication.pin_replica()
+        try:
+            return self.get_response(request)
+        finally:
+            replication.unpin_replica(token)
+
+
+class ReadYourWritesMiddleware:
+    """
+    Makes sure clients can read their own writes, without sending all of their reads to the primary database.
+
+    After a successful request that wrote to the frames tables, the primary's WAL position is returned in the
+    X-Archive-Read-After header, and remembered for the client's credentials for a short while. Reads on later
+    requests from the same client, or requests that send the header back, go to the primary until the replica
+    has caught up. Requests that only read, like zip downloads and thumbnail lookups, leave the client's
+    reads on the replicas.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        cache_key = read_after_cache_key(request)
+        required_lsn = request.headers.get(READ_AFTER_HEADER)
+        if required_lsn is None and cache_key is not None:
+            required_lsn = cache.get(cache_key)
+        token = replication.set_required_lsn(required_lsn)
+        wrote = []
+
+        def record_writes(execute, sql, params, many, context):
+            if not wrote and FRAMES_WRITE.match(sql):
+                wrote.append(True)
+            return execute(sql, params, many, context)
+
+        try:
+            with ExitStack() as stack:
+                if request.method not in SAFE_METHODS:
+                    stack.enter_context(connections['default'].execute_wrapper(record_writes))
+                response = self.get_response(request)
+        finally:
+            replication.reset_required_lsn(token)
+
+        if wrote and response.status_code < 400:
+            lsn = replication.get_primary_lsn()
+            if lsn is not None:
+                response[READ_AFTER_HEADER] = lsn
+                if cache_key is not None:
+                    cache.set(cache_key, lsn, settings.READ_YOUR_WRITES_SECONDS)
+        return response
+
+
+class CompressionMiddleware:
+    """
+    Compresses responses with zstd, brotli or gzip, whichever the client prefers out of the ones available.
+
+    Only the content types in RESPONSE_COMPRESSION_CONTENT_TYPES are compressed, which leaves out binary
+    downloads such as funpacked FITS files, and HTML pages, whose CSRF tokens would be exposed to BREACH
+    attacks. The mod_zip manifest is never compressed, since nginx has to read it. Streaming responses are
+    compressed chunk by chunk.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def should_compress(self, response):
+        if not settings.RESPONSE_COMPRESSION_ENABLED or response.has_header('Content-Encoding'):
+            return False
+        if response.has_header('X-Archive-Files'):
+            return False
+        content_type = response.get('Content-Type', '').split(';')[0].strip().lower()
+        if content_type not in settings.RESPONSE_COMPRESSION_CONTENT_TYPES:
+            return False
+        return response.streaming or len(response.content) >= settings.RESPONSE_COMPRESSION_MIN_BYTES
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if not self.should_compress(response):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = compression.choose_encoding(
+            request.headers.get('Accept-Encoding', ''), list(compression.get_compressors())
+        )
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            response.streaming_content = compression.compress_sequence(response.streaming_content, encoding)
+            del response['Content-Length']
+        else:
+            compressed_content = compression.compress(response.content, encoding)
+            if len(compressed_content) >= len(response.content):
+                return response
+            response.content = compressed_content
+            response['Content-Length'] = str(len(response.content))
+
+        # The compressed body is no longer byte for byte the same as the one a strong ETag was made for
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encoding
+        return response
+
+
+class TimingMiddleware:
+    """
+    Records the number and duration of database queries per database alias, file store calls, counts,
+    serialization and rendering of each request. They are returned in the Server-Timing header to staff
+    users only, as they describe the internals of the archive, and logged for requests that take longer
+    than REQUEST_TIMING_LOG_THRESHOLD_MS.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.REQUEST_TIMING_ENABLED:
+            return self.get_response(request)
+
+        timings, token = timing.start()
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(timing.database_timer(alias)))
+                response = self.get_response(request)
+        finally:
+            timing.stop(token)
+
+        # DRF sets the user it authenticated on the request, so token authenticated staff get the header too
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_staff:
+            response['Server-Timing'] = timings.server_timing()
+        if timings.total_ms() >= settings.REQUEST_TIMING_LOG_THRESHOLD_MS:
+            tags = {'method': request.method, 'path': request.path, 'status': response.status_code}
+            tags.update(timings.as_tags())
+            logger.info('Request timings', extra={'tags': tags})
+        return response
@@ -1,6 +1,42 @@
-from rest_framework.renderers import BrowsableAPIRenderer
+from rest_framework.renderers import BrowsableAPIRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
 from django.conf import settings
 
+from archive import timing
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    Renders JSON with orjson, which is several times faster than the standard library on large
+    pages of frames. The output is the same as DRF's JSONRenderer: compact, UTF-8, datetimes in
+    UTC ending in Z, and anything orjson doesn't handle natively, like sets and lazy strings, is
+    converted by DRF's encoder. The one difference is that NaN and infinite floats render as null
+    instead of raising an error. Falls back to JSONRenderer if orjson isn't installed, an indent is
+    requested, or the data can't be rendered by orjson, e.g. integers larger than 64 bits.
+    """
+    options = (orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS) if orjson else 0
+
+    @timing.timed('render')
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        renderer_context = renderer_context or {}
+        indent = self.get_indent(accepted_media_type, renderer_context)
+        if orjson is None or indent or not self.compact or self.ensure_ascii:
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=JSONEncoder().default, option=self.options)
+        except (orjson.JSONEncodeError, TypeError):
+            return super().render(data, accepted_media_type, renderer_context)
+        # Escape the same characters as JSONRenderer, which are valid JSON but not valid javascript
+        return ret.replace('\u2028'.encode('utf-8'), b'\\u2028').replace('\u2029'.encode('utf-8'), b'\\u2029')
+
+
 # This overrides the default browsable api renderer so that we can pass custom values
 # into the template (eg. users might want to configure the title text)
 class CustomBrowsableAPIRenderer(BrowsableAPIRenderer):
@@ -0,0 +1,181 @@
+"""
+Tracks how far each read replica is behind the primary database, so that reads are spread over the
+healthy replicas and only sent to the primary when the data they need may not have been replicated yet.
+
+Replica lag and the replica's replayed WAL position are measured with a query that is cached in
+process for a few seconds, and measured again in a background thread once it expires, so that requests
+never wait on a replica that is slow to connect to. Replicas that haven't been measured yet, that can't
+be queried, or that are too far behind, are left out of the pool until they are checked again. Requests can also carry a read-your-writes token: the primary's WAL
+position (LSN) after a write. Reads made while handling such a request go to the primary until the
+replica has replayed past that position.
+"""
+from contextvars import ContextVar
+import threading
+import logging
+import random
+import time
+
+from django.conf import settings
+from django.db import connections, DatabaseError
+
+logger = logging.getLogger()
+
+_required_lsn = ContextVar('required_lsn', default=None)
+_pinned_replica = ContextVar('pinned_replica', default=None)
+_replica_state = {}
+_refreshing = set()
+_lock = threading.Lock()
+
+REPLICA_STATE_SQL = '''
+    SELECT
+      CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+      END,
+      pg_last_wal_replay_lsn()::text
+'''
+
+
+def parse_lsn(lsn):
+    """
+    Convert a postgres LSN like 16/B374D848 to an integer that can be compared
+    """
+    high, low = lsn.split('/')
+    return (int(high, 16) << 32) + int(low, 16)
+
+
+def measure_replica_state(alias):
+    with connections[alias].cursor() as cursor:
+        cursor.execute(REPLICA_STATE_SQL)
+        lag, replay_lsn = cursor.fetchone()
+    return float(lag), parse_lsn(replay_lsn) if replay_lsn else None
+
+
+def refresh_replica_state(alias):
+    """
+    Measures the state of the replica and caches it. Runs in its own thread, whose connection is closed afterwards.
+    """
+    try:
+        state = measure_replica_state(alias)
+        expires = time.monotonic() + settings.REPLICA_LAG_CACHE_SECONDS
+    except DatabaseError as e:
+        logger.warning('Failed to get the replica lag: {}'.format(repr(e)), extra={'tags': {'alias': alias}})
+        state = None
+        # Don't try to connect to a failing replica again on every request
+        expires = time.monotonic() + settings.REPLICA_EVICTION_SECONDS
+    finally:
+        connections[alias].close()
+        with _lock:
+            _refreshing.discard(alias)
+    with _lock:
+        _replica_state[alias] = (expires, state)
+
+
+def get_replica_state(alias):
+    """
+    Returns the (lag in seconds, replayed LSN) of the replica. The LSN is None if the database is not
+    a replica. Returns None if the replica could not be queried, or hasn't been yet. An expired state
+    is returned until it has been measured again in the background.
+    """
+    cached = _replica_state.get(alias)
+    if cached is None or time.monotonic() >= cached[0]:
+        with _lock:
+            start_refresh = alias not in _refreshing
+            _refreshing.add(alias)
+        if start_refresh:
+            threading.Thread(
+                target=refresh_replica_state, args=(alias,), name=f'replica-state-{alias}', daemon=True
+            ).start()
+    return cached[1] if cached is not None else None
+
+
+def get_replica_lag(alias):
+    state = get_replica_state(alias)
+    return state[0] if state is not None else None
+
+
+def replica_is_healthy(alias):
+    lag = get_replica_lag(alias)
+    return lag is not None and lag <= settings.REPLICA_MAX_LAG_SECONDS
+
+
+def choose_replica():
+    """
+    Pick one of the healthy replicas, in proportion to their weights. Returns None if none are healthy.
+    """
+    replicas = [alias for alias in settings.REPLICA_DATABASES if replica_is_healthy(alias)]
+    if len(replicas) <= 1:
+        return replicas[0] if replicas else None
+    weights = [settings.REPLICA_WEIGHTS[alias] for alias in replicas]
+    return random.choices(replicas, weights=weights)[0]
+
+
+def pin_replica():
+    """
+    Make every read in the current context use the same replica, so that all of the queries of a request,
+    like its count, page and prefetch queries, see the same data. The replica is chosen on the first read.
+    Returns a token to pass to unpin_replica.
+    """
+    return _pinned_replica.set({})
+
+
+def unpin_replica(token):
+    _pinned_replica.reset(token)
+
+
+def get_replica():
+    """
+    Returns the replica pinned to the current context, choosing it on the first call, or a newly chosen
+    replica if none is pinned. Returns None if none are healthy.
+    """
+    pinned = _pinned_replica.get()
+    if pinned is None:
+        return choose_replica()
+    if 'alias' not in pinned:
+        pinned['alias'] = choose_replica()
+    return pinned['alias']
+
+
+def get_primary_lsn():
+    """
+    Returns the current WAL position of the primary database, or None if it could not be queried
+    """
+    try:
+        with connections['default'].cursor() as cursor:
+            cursor.execute('SELECT pg_current_wal_lsn()::text')
+            return cursor.fetchone()[0]
+    except DatabaseError as e:
+        logger.warning('Failed to get the primary WAL position: {}'.format(repr(e)))
+        return None
+
+
+def set_required_lsn(lsn):
+    """
+    Require reads in the current context to see writes up to the given LSN. Returns a token to pass to
+    reset_required_lsn.
+    """
+    try:
+        required_lsn = parse_lsn(lsn) if lsn else None
+    except ValueError:
+        required_lsn = None
+    return _required_lsn.set(required_lsn)
+
+
+def reset_required_lsn(token):
+    _required_lsn.reset(token)
+
+
+def replica_is_caught_up(alias):
+    """
+    Returns whether the replica has replayed the writes required by the current context
+    """
+    required_lsn = _required_lsn.get()
+    if required_lsn is None:
+        return True
+    state = get_replica_state(alias)
+    if state is None:
+        return False
+    replay_lsn = state[1]
+    # A database that isn't a replica has all of the writes
+    return replay_lsn is None or replay_lsn >= required_lsn
@@ -52,11 +52,15 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'archive.middleware.TimingMiddleware',
+    'archive.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'archive.middleware.PinReplicaMiddleware',
+    'archive.middleware.ReadYourWritesMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -97,6 +101,26 @@ DB_NAME = os.getenv('DB_NAME', 'archive')
 DB_USER = os.getenv('DB_USER', 'postgres')
 DB_PASS = os.getenv('DB_PASS', 'postgres')
 
+
+def get_connection_settings(prefix):
+    """
+    Connection settings for a database alias, from the environment variables starting with the given
+    prefix. Any that aren't set fall back to the ones for the writer endpoint, starting with DB_.
+    """
+    def getenv(name, default):
+        return os.getenv(f'{prefix}_{name}', os.getenv(f'DB_{name}', default))
+
+    return {
+        # Number of seconds to keep connections open between requests. None keeps them open indefinitely.
+        'CONN_MAX_AGE': ast.literal_eval(getenv('CONN_MAX_AGE', '0')),
+        'CONN_HEALTH_CHECKS': ast.literal_eval(getenv('CONN_HEALTH_CHECKS', 'True')),
+        # A transaction pooling PgBouncer can hand the server connection to another client between
+        # transactions, which would break server side cursors
+        'DISABLE_SERVER_SIDE_CURSORS': ast.literal_eval(getenv('PGBOUNCER', 'False')),
+        'OPTIONS': {'connect_timeout': int(getenv('CONNECT_TIMEOUT_SECONDS', '5'))},
+    }
+
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.contrib.gis.db.backends.postgis',
@@ -105,16 +129,38 @@ DATABASES = {
         'PASSWORD': DB_PASS,
         'HOST': os.getenv('DB_HOST', '127.0.0.1'),
         'PORT': os.getenv('DB_PORT', '5432'),
+        **get_connection_settings('DB'),
     },
-    'replica': {
+}
+
+# Reads are spread over a pool of reader endpoints. The first reader uses the 'replica' alias, and any
+# others use 'replica_1', 'replica_2', etc. Each reader is picked in proportion to its weight.
+DB_HOST_READERS = get_tuple_from_environment('DB_HOST_READERS', os.getenv('DB_HOST_READER', '127.0.0.1'))
+DB_HOST_READER_WEIGHTS = get_tuple_from_environment('DB_HOST_READER_WEIGHTS', '')
+REPLICA_WEIGHTS = {}
+for index, host in enumerate(DB_HOST_READERS):
+    alias = 'replica' if index == 0 else f'replica_{index}'
+    DATABASES[alias] = {
         'ENGINE': 'django.contrib.gis.db.backends.postgis',
         'NAME': DB_NAME,
         'USER': DB_USER,
         'PASSWORD': DB_PASS,
-        'HOST': os.getenv('DB_HOST_READER', '127.0.0.1'),
-        'PORT': os.getenv('DB_PORT', '5432'),
+        'HOST': host,
+        'PORT': os.getenv('DB_READER_PORT', os.getenv('DB_PORT', '5432')),
+        **get_connection_settings('DB_READER'),
     }
-}
+    weight = DB_HOST_READER_WEIGHTS[index] if index < len(DB_HOST_READER_WEIGHTS) else ''
+    REPLICA_WEIGHTS[alias] = int(weight or 1)
+REPLICA_DATABASES = tuple(REPLICA_WEIGHTS)
+
+# Reads of recently created frames, and reads by clients that have recently written, go to the writer
+# endpoint until the reader endpoint has caught up with them. Readers that can't be reached, or that
+# fall too far behind, are taken out of the pool until they recover.
+REPLICA_LAG_CACHE_SECONDS = float(os.getenv('REPLICA_LAG_CACHE_SECONDS', 5))
+REPLICA_LAG_SAFETY_SECONDS = float(os.getenv('REPLICA_LAG_SAFETY_SECONDS', 5))
+REPLICA_MAX_LAG_SECONDS = float(os.getenv('REPLICA_MAX_LAG_SECONDS', 300))
+REPLICA_EVICTION_SECONDS = float(os.getenv('REPLICA_EVICTION_SECONDS', 30))
+READ_YOUR_WRITES_SECONDS = int(os.getenv('READ_YOUR_WRITES_SECONDS', 300))
 
 
 # Password validation
@@ -209,11 +255,23 @@ REST_FRAMEWORK = {
         'django_filters.rest_framework.DjangoFilterBackend',
     ),
     'DEFAULT_RENDERER_CLASSES': (
-        'rest_framework.renderers.JSONRenderer',
+        'archive.renderers.FastJSONRenderer',
         'archive.renderers.CustomBrowsableAPIRenderer',
-    )
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'archive.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
 }
 
+# Settings for the shared http client used to call the oauth server and configdb
+HTTP_CLIENT_POOL_SIZE = int(os.getenv('HTTP_CLIENT_POOL_SIZE', 10))
+HTTP_CLIENT_CONNECT_TIMEOUT_SECONDS = float(os.getenv('HTTP_CLIENT_CONNECT_TIMEOUT_SECONDS', 3))
+HTTP_CLIENT_READ_TIMEOUT_SECONDS = float(os.getenv('HTTP_CLIENT_READ_TIMEOUT_SECONDS', 10))
+HTTP_CLIENT_CIRCUIT_BREAKER_THRESHOLD = int(os.getenv('HTTP_CLIENT_CIRCUIT_BREAKER_THRESHOLD', 5))
+HTTP_CLIENT_CIRCUIT_BREAKER_RESET_SECONDS = int(os.getenv('HTTP_CLIENT_CIRCUIT_BREAKER_RESET_SECONDS', 30))
+
 # This project now requires connection to an OAuth server for authenticating users to make changes
 # In the OCS, this would be the Observation Portal backend
 OCS_AUTHENTICATION = {
@@ -222,10 +280,19 @@ OCS_AUTHENTICATION = {
     'OAUTH_CLIENT_ID': os.getenv('OAUTH_CLIENT_ID', ''),
     'OAUTH_CLIENT_SECRET': os.getenv('OAUTH_CLIENT_SECRET', ''),
     'OAUTH_SERVER_KEY': os.getenv('OAUTH_SERVER_KEY', ''),
-    'REQUESTS_TIMEOUT_SECONDS': 60
+    # Used by the ocs_authentication backends, bounded by the shared http client read timeout by default
+    'REQUESTS_TIMEOUT_SECONDS': float(os.getenv('OAUTH_REQUESTS_TIMEOUT_SECONDS', HTTP_CLIENT_READ_TIMEOUT_SECONDS))
 }
 
+# How long a user resolved from an oauth bearer token is cached before the auth server is asked again
+BEARER_AUTH_CACHE_TIMEOUT = int(os.getenv('BEARER_AUTH_CACHE_TIMEOUT', 300))
+PROPOSALS_CACHE_TIMEOUT = int(os.getenv('PROPOSALS_CACHE_TIMEOUT', 3600))
+PROPOSALS_CACHE_MAX_STALE_SECONDS = int(os.getenv('PROPOSALS_CACHE_MAX_STALE_SECONDS', 86400))
+PROPOSALS_CACHE_FAILURE_TIMEOUT = int(os.getenv('PROPOSALS_CACHE_FAILURE_TIMEOUT', 60))
+PROPOSALS_CACHE_REFRESH_WORKERS = int(os.getenv('PROPOSALS_CACHE_REFRESH_WORKERS', 4))
+
 CORS_ORIGIN_ALLOW_ALL = True
+CORS_EXPOSE_HEADERS = ['X-Archive-Read-After']
 
 if os.getenv('CACHE_LOC', None) is not None:
     CACHES = {
@@ -256,6 +323,30 @@ SCIENCE_CONFIGURATION_TYPES = get_tuple_from_environment('SCIENCE_CONFIGURATION_
 ZIP_DOWNLOAD_FILENAME_BASE = os.getenv('ZIP_DOWNLOAD_FILENAME_BASE', 'ocs_archive_data')
 ZIP_DOWNLOAD_MAX_UNCOMPRESSED_FILES = int(os.getenv('ZIP_DOWNLOAD_MAX_UNCOMPRESSED_FILES', 10))
 THUMBNAIL_SIZE_CHOICES = get_tuple_from_environment('THUMBNAIL_SIZE_CHOICES', 'small,medium,large')
+THUMBNAIL_LOOKUP_MAX_FRAMES = int(os.getenv('THUMBNAIL_LOOKUP_MAX_FRAMES', 1000))
+FRAME_EXPORT_CHUNK_SIZE = int(os.getenv('FRAME_EXPORT_CHUNK_SIZE', 2000))
+
+# Compression of API responses, with zstd or brotli if their optional packages are installed, or gzip
+RESPONSE_COMPRESSION_ENABLED = ast.literal_eval(os.getenv('RESPONSE_COMPRESSION_ENABLED', 'True'))
+RESPONSE_COMPRESSION_MIN_BYTES = int(os.getenv('RESPONSE_COMPRESSION_MIN_BYTES', 1024))
+RESPONSE_COMPRESSION_CONTENT_TYPES = get_tuple_from_environment(
+    'RESPONSE_COMPRESSION_CONTENT_TYPES',
+    'application/json,application/x-ndjson,text/csv,application/vnd.apache.arrow.stream,application/openapi+json'
+)
+
+# Per request timings, returned in the Server-Timing header to staff users and logged for slow requests. Every
+# query is timed, so they are off by default.
+REQUEST_TIMING_ENABLED = ast.literal_eval(os.getenv('REQUEST_TIMING_ENABLED', 'False'))
+REQUEST_TIMING_LOG_THRESHOLD_MS = float(os.getenv('REQUEST_TIMING_LOG_THRESHOLD_MS', 1000))
+
+# Prometheus metrics at /metrics/, if the optional prometheus_client package is installed. They describe the
+# internals of the archive, so they are off by default, and scrapes must send the token if one is set.
+METRICS_ENABLED = ast.literal_eval(os.getenv('METRICS_ENABLED', 'False'))
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# Time allowed for each probe of the deep health check at /health/deep/, and how long its result is cached for
+HEALTH_CHECK_TIMEOUT_SECONDS = float(os.getenv('HEALTH_CHECK_TIMEOUT_SECONDS', 2))
+HEALTH_CHECK_CACHE_SECONDS = float(os.getenv('HEALTH_CHECK_CACHE_SECONDS', 10))
 NAVBAR_TITLE_TEXT = os.getenv('NAVBAR_TITLE_TEXT', 'Science Archive API')
 NAVBAR_TITLE_URL = os.getenv('NAVBAR_TITLE_URL', 'https://archive.lco.global')
 TERMS_OF_SERVICE_URL = os.getenv('TERMS_OF_SERVICE_URL', 'https://lco.global/policies/terms/')
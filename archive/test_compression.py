@@ -0,0 +1,47 @@
+from archive.compression import choose_encoding
+from archive.middleware import CompressionMiddleware
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import SimpleTestCase, RequestFactory
+
+import gzip
+import json
+
+
+class TestCompressionMiddleware(SimpleTestCase):
+    body = json.dumps({'results': [{'basename': 'frame{}'.format(i)} for i in range(100)]}).encode('utf-8')
+
+    def get_response(self, response, accept_encoding='gzip'):
+        request = RequestFactory().get('/frames/', HTTP_ACCEPT_ENCODING=accept_encoding)
+        return CompressionMiddleware(lambda request: response)(request)
+
+    def test_choose_encoding(self):
+        self.assertEqual(choose_encoding('gzip, br;q=0.9, zstd', ['zstd', 'br', 'gzip']), 'zstd')
+        self.assertEqual(choose_encoding('gzip;q=0.5, br', ['zstd', 'br', 'gzip']), 'br')
+        self.assertEqual(choose_encoding('gzip;q=0.5, *;q=0', ['zstd', 'gzip']), 'gzip')
+        self.assertIsNone(choose_encoding('identity', ['zstd', 'gzip']))
+
+    def test_compresses_json(self):
+        response = self.get_response(HttpResponse(self.body, content_type='application/json'))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(gzip.decompress(response.content), self.body)
+
+    def test_compresses_streaming_responses(self):
+        response = self.get_response(StreamingHttpResponse(
+            (line + b'\n' for line in self.body.split(b',')), content_type='application/x-ndjson'
+        ))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), self.body.replace(b',', b'\n') + b'\n')
+
+    def test_skips_binary_and_zip_manifest_responses(self):
+        response = self.get_response(HttpResponse(self.body, content_type='application/octet-stream'))
+        self.assertFalse(response.has_header('Content-Encoding'))
+        zip_response = HttpResponse(self.body, content_type='application/json')
+        zip_response['X-Archive-Files'] = 'zip'
+        self.assertFalse(self.get_response(zip_response).has_header('Content-Encoding'))
+
+    def test_skips_small_responses_and_unsupported_clients(self):
+        response = self.get_response(HttpResponse(b'{}', content_type='application/json'))
+        self.assertFalse(response.has_header('Content-Encoding'))
+        response = self.get_response(HttpResponse(self.body, content_type='application/json'), accept_encoding='')
+        self.assertFalse(response.has_header('Content-Encoding'))
@@ -0,0 +1,22 @@
+from archive.settings import get_connection_settings
+from django.test import SimpleTestCase
+from unittest.mock import patch
+
+import os
+
+
+class TestConnectionSettings(SimpleTestCase):
+    @patch.dict(os.environ, {'DB_CONN_MAX_AGE': '60', 'DB_READER_PGBOUNCER': 'True', 'DB_READER_CONN_MAX_AGE': '0'})
+    def test_reader_settings_override_writer_settings(self):
+        writer = get_connection_settings('DB')
+        reader = get_connection_settings('DB_READER')
+        self.assertEqual(writer['CONN_MAX_AGE'], 60)
+        self.assertFalse(writer['DISABLE_SERVER_SIDE_CURSORS'])
+        self.assertEqual(reader['CONN_MAX_AGE'], 0)
+        self.assertTrue(reader['DISABLE_SERVER_SIDE_CURSORS'])
+
+    @patch.dict(os.environ, {'DB_CONN_MAX_AGE': 'None', 'DB_CONNECT_TIMEOUT_SECONDS': '2'})
+    def test_reader_settings_fall_back_to_writer_settings(self):
+        reader = get_connection_settings('DB_READER')
+        self.assertIsNone(reader['CONN_MAX_AGE'])
+        self.assertEqual(reader['OPTIONS'], {'connect_timeout': 2})
@@ -0,0 +1,93 @@
+from archive import replication
+from archive.dbrouters import DBClusterRouter
+from archive.frames.models import Frame
+from archive.middleware import PinReplicaMiddleware
+from django.conf import settings
+from django.http import HttpResponse
+from django.test import SimpleTestCase, RequestFactory
+from unittest.mock import patch
+
+import datetime
+import threading
+import time
+
+
+class TestDBRouter(SimpleTestCase):
+    def setUp(self):
+        self.router = DBClusterRouter()
+
+    def frame_created(self, seconds_ago):
+        return Frame(created=datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=seconds_ago))
+
+    @patch('archive.replication.get_replica_state', return_value=(2.0, None))
+    def test_new_instance_window_follows_replica_lag(self, mock_state):
+        self.assertEqual(self.router.db_for_read(Frame, instance=self.frame_created(1)), 'default')
+        self.assertEqual(self.router.db_for_read(Frame, instance=self.frame_created(60)), 'replica')
+
+    @patch('archive.replication.get_replica_state', return_value=None)
+    def test_unreachable_replica_routes_to_writer(self, mock_state):
+        self.assertEqual(self.router.db_for_read(Frame), 'default')
+
+    @patch('archive.replication.get_replica_state', return_value=(settings.REPLICA_MAX_LAG_SECONDS + 1, None))
+    def test_lagging_replica_routes_to_writer(self, mock_state):
+        self.assertEqual(self.router.db_for_read(Frame), 'default')
+
+    @patch('archive.replication.get_replica_state')
+    def test_replica_pool_skips_unhealthy_replicas(self, mock_state):
+        mock_state.side_effect = lambda alias: None if alias == 'replica' else (0.0, None)
+        with self.settings(REPLICA_DATABASES=('replica', 'replica_1'), REPLICA_WEIGHTS={'replica': 1, 'replica_1': 1}):
+            for _ in range(10):
+                self.assertEqual(replication.choose_replica(), 'replica_1')
+
+    @patch('archive.replication.get_replica_state', return_value=(0.0, None))
+    def test_replica_pool_uses_weights(self, mock_state):
+        with self.settings(REPLICA_DATABASES=('replica', 'replica_1'), REPLICA_WEIGHTS={'replica': 0, 'replica_1': 1}):
+            for _ in range(10):
+                self.assertEqual(replication.choose_replica(), 'replica_1')
+
+    def test_parse_lsn_orders_positions(self):
+        self.assertLess(replication.parse_lsn('0/FFFFFFFF'), replication.parse_lsn('1/0'))
+        self.assertLess(replication.parse_lsn('16/B374D848'), replication.parse_lsn('16/B374D849'))
+
+    @patch('archive.replication.get_replica_state', return_value=(0.0, replication.parse_lsn('0/100')))
+    def test_required_lsn_routes_to_writer_until_replayed(self, mock_state):
+        token = replication.set_required_lsn('0/200')
+        try:
+            self.assertEqual(self.router.db_for_read(Frame), 'default')
+        finally:
+            replication.reset_required_lsn(token)
+        token = replication.set_required_lsn('0/80')
+        try:
+            self.assertEqual(self.router.db_for_read(Frame), 'replica')
+        finally:
+            replication.reset_required_lsn(token)
+
+    @patch('archive.replication.choose_replica', side_effect=['replica', 'replica_1', 'replica'])
+    def test_pinned_replica_is_used_for_every_read(self, mock_choose):
+        aliases = []
+
+        def get_response(request):
+            aliases.extend(self.router.db_for_read(Frame) for _ in range(3))
+            return HttpResponse()
+        PinReplicaMiddleware(get_response)(RequestFactory().get('/frames/'))
+        self.assertEqual(aliases, ['replica'] * 3)
+        mock_choose.assert_called_once()
+        # Outside of a request a replica is chosen for every read
+        self.assertEqual(self.router.db_for_read(Frame), 'replica_1')
+
+    def test_replica_state_is_measured_in_the_background(self):
+        measured = threading.Event()
+
+        def measure_replica_state(alias):
+            measured.wait(5)
+            return 1.0, None
+        with patch('archive.replication.measure_replica_state', side_effect=measure_replica_state), \
+                patch.dict(replication._replica_state, clear=True):
+            # The request doesn't wait for the replica, and doesn't use it until it has been measured
+            self.assertIsNone(replication.get_replica_state('replica'))
+            measured.set()
+            for _ in range(50):
+                if 'replica' in replication._replica_state:
+                    break
+                time.sleep(0.1)
+            self.assertEqual(replication.get_replica_state('replica'), (1.0, None))
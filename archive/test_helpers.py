@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.test import TestCase
 from django.db import connections
 
@@ -7,15 +8,21 @@ class ReplicationTestCase(TestCase):
     Redirect queries in tests to the default database.
     This is a workaround for https://code.djangoproject.com/ticket/23718
     """
-    databases = {'default', 'replica'}
+    databases = {'default', *settings.REPLICA_DATABASES}
 
     @classmethod
     def setUpClass(cls):
         super(ReplicationTestCase, cls).setUpClass()
-        connections['replica']._orig_cursor = connections['replica'].cursor
-        connections['replica'].cursor = connections['default'].cursor
+        for alias in settings.REPLICA_DATABASES:
+            connections[alias]._orig_cursor = connections[alias].cursor
+            connections[alias]._orig_chunked_cursor = connections[alias].chunked_cursor
+            connections[alias].cursor = connections['default'].cursor
+            # Used by QuerySet.iterator()
+            connections[alias].chunked_cursor = connections['default'].chunked_cursor
 
     @classmethod
     def tearDownClass(cls):
-        connections['replica'].cursor = connections['replica']._orig_cursor
+        for alias in settings.REPLICA_DATABASES:
+            connections[alias].cursor = connections[alias]._orig_cursor
+            connections[alias].chunked_cursor = connections[alias]._orig_chunked_cursor
         super(ReplicationTestCase, cls).tearDownClass()
@@ -0,0 +1,47 @@
+from archive import http_client
+from archive.authentication.models import get_oauth_profile
+from archive.http_client import CircuitBreaker, CircuitOpenError
+from django.conf import settings
+from django.test import SimpleTestCase, override_settings
+from unittest.mock import patch
+
+import requests
+import responses
+
+
+class TestHttpClient(SimpleTestCase):
+    def test_circuit_opens_after_threshold(self):
+        circuit_breaker = CircuitBreaker(failure_threshold=2, reset_seconds=30)
+        circuit_breaker.record_failure('configdb')
+        circuit_breaker.before_request('configdb')
+        circuit_breaker.record_failure('configdb')
+        with self.assertRaises(CircuitOpenError):
+            circuit_breaker.before_request('configdb')
+        # Other hosts are unaffected
+        circuit_breaker.before_request('oauth')
+
+    def test_success_closes_circuit(self):
+        circuit_breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0)
+        circuit_breaker.record_failure('configdb')
+        self.assertTrue(circuit_breaker.is_open('configdb'))
+        # After the reset period a trial request is allowed through
+        circuit_breaker.before_request('configdb')
+        circuit_breaker.record_success('configdb')
+        self.assertFalse(circuit_breaker.is_open('configdb'))
+
+    @responses.activate
+    def test_connection_errors_open_circuit(self):
+        responses.add(responses.GET, 'http://flaky-service/', body=requests.exceptions.ConnectionError())
+        for _ in range(settings.HTTP_CLIENT_CIRCUIT_BREAKER_THRESHOLD):
+            with self.assertRaises(requests.exceptions.ConnectionError):
+                http_client.get('http://flaky-service/')
+        with self.assertRaises(CircuitOpenError):
+            http_client.get('http://flaky-service/')
+        self.assertEqual(len(responses.calls), settings.HTTP_CLIENT_CIRCUIT_BREAKER_THRESHOLD)
+
+    @override_settings(HTTP_CLIENT_CONNECT_TIMEOUT_SECONDS=1, HTTP_CLIENT_READ_TIMEOUT_SECONDS=4)
+    @patch('archive.http_client.get_session')
+    def test_oauth_profile_is_bounded_by_read_timeout(self, mock_get_session):
+        mock_get_session.return_value.request.return_value.status_code = 200
+        get_oauth_profile('Bearer token')
+        self.assertEqual(mock_get_session.return_value.request.call_args.kwargs['timeout'], (1, 4))
@@ -0,0 +1,37 @@
+from archive.parsers import FastJSONParser
+from archive.renderers import FastJSONRenderer
+from django.test import SimpleTestCase
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+
+import datetime
+import decimal
+import io
+
+
+class TestFastJSON(SimpleTestCase):
+    def test_renders_same_as_json_renderer(self):
+        data = {
+            'observation_date': datetime.datetime(2020, 1, 1, 1, 2, 3, 4567, tzinfo=datetime.timezone.utc),
+            'observation_day': datetime.date(2020, 1, 1),
+            'sites': {'ogg', 'coj'},
+            'exposure_time': decimal.Decimal('1.5'),
+            'target_name': 'M\u00e9\u2028',
+            'values': [0.1, 1e16, None, True],
+            1: 'integer key',
+            'large': 2 ** 70,
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(FastJSONRenderer().render(None), b'')
+
+    def test_indent_falls_back_to_json_renderer(self):
+        data = {'a': [1, 2]}
+        self.assertEqual(
+            FastJSONRenderer().render(data, 'application/json; indent=4'),
+            JSONRenderer().render(data, 'application/json; indent=4')
+        )
+
+    def test_parses_json(self):
+        self.assertEqual(FastJSONParser().parse(io.BytesIO(b'{"frame_ids": [1, 2]}')), {'frame_ids': [1, 2]})
+        with self.assertRaises(ParseError):
+            FastJSONParser().parse(io.BytesIO(b'{"exposure_time": NaN}'))
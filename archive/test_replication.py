@@ -0,0 +1,39 @@
+from archive import replication
+from archive.frames.models import Frame
+from archive.frames.tests.factories import FrameFactory
+from archive.middleware import ReadYourWritesMiddleware, READ_AFTER_HEADER
+from archive.test_helpers import ReplicationTestCase
+from django.http import HttpResponse
+from django.test import RequestFactory
+from unittest.mock import patch
+
+
+class TestReadYourWrites(ReplicationTestCase):
+    @patch('archive.replication.get_primary_lsn', return_value='0/200')
+    def test_write_returns_read_after_token(self, mock_lsn):
+        def get_response(request):
+            FrameFactory()
+            return HttpResponse(status=201)
+        request = RequestFactory().post('/frames/', HTTP_AUTHORIZATION='Token abc')
+        response = ReadYourWritesMiddleware(get_response)(request)
+        self.assertEqual(response[READ_AFTER_HEADER], '0/200')
+
+        required_lsns = []
+
+        def get_response(request):
+            required_lsns.append(replication._required_lsn.get())
+            return HttpResponse()
+
+        # A later read by the same client must see the write
+        ReadYourWritesMiddleware(get_response)(RequestFactory().get('/frames/', HTTP_AUTHORIZATION='Token abc'))
+        self.assertEqual(required_lsns, [replication.parse_lsn('0/200')])
+
+    @patch('archive.replication.get_primary_lsn', return_value='0/200')
+    def test_read_only_post_returns_no_token(self, mock_lsn):
+        def get_response(request):
+            Frame.objects.count()
+            return HttpResponse()
+        request = RequestFactory().post('/frames/zip/', HTTP_AUTHORIZATION='Token abc')
+        response = ReadYourWritesMiddleware(get_response)(request)
+        self.assertFalse(response.has_header(READ_AFTER_HEADER))
+        mock_lsn.assert_not_called()
@@ -0,0 +1,47 @@
+from archive import timing
+from archive.middleware import TimingMiddleware
+from django.http import HttpResponse
+from django.test import SimpleTestCase, RequestFactory, override_settings
+from types import SimpleNamespace
+
+
+@override_settings(REQUEST_TIMING_ENABLED=True)
+class TestTimingMiddleware(SimpleTestCase):
+    def get_request(self, is_staff=True):
+        request = RequestFactory().get('/frames/')
+        request.user = SimpleNamespace(is_staff=is_staff)
+        return request
+
+    def get_response(self, request):
+        timing.record('storage', 0.002)
+        timing.record('storage', 0.003)
+        with timing.timed('serialize'):
+            pass
+        return HttpResponse(b'{}', content_type='application/json')
+
+    def test_server_timing_header(self):
+        response = TimingMiddleware(self.get_response)(self.get_request())
+        metrics = {metric.split(';')[0]: metric for metric in response['Server-Timing'].split(', ')}
+        self.assertEqual(set(metrics), {'storage', 'serialize', 'total'})
+        self.assertIn('dur=5.000', metrics['storage'])
+        self.assertIn('desc="count=2"', metrics['storage'])
+
+    @override_settings(REQUEST_TIMING_LOG_THRESHOLD_MS=0)
+    def test_slow_requests_are_logged(self):
+        with self.assertLogs(level='INFO') as logs:
+            TimingMiddleware(self.get_response)(self.get_request(is_staff=False))
+        tags = logs.records[-1].tags
+        self.assertEqual(tags['path'], '/frames/')
+        self.assertEqual(tags['storage_count'], 2)
+        self.assertIn('total_ms', tags)
+
+    def test_no_header_for_other_users(self):
+        response = TimingMiddleware(self.get_response)(self.get_request(is_staff=False))
+        self.assertFalse(response.has_header('Server-Timing'))
+        response = TimingMiddleware(self.get_response)(RequestFactory().get('/frames/'))
+        self.assertFalse(response.has_header('Server-Timing'))
+
+    @override_settings(REQUEST_TIMING_ENABLED=False)
+    def test_disabled(self):
+        response = TimingMiddleware(self.get_response)(self.get_request())
+        self.assertFalse(response.has_header('Server-Timing'))
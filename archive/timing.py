@@ -0,0 +1,119 @@
+"""
+Records where the time of a request goes: database queries per database alias, file store calls, count
+queries, serialization and rendering. The timings are returned in the Server-Timing header, where browser
+developer tools can show them, and logged with the request when it is slow.
+
+Timings are kept per request in a context variable, so code that runs outside of a request, like
+management commands, records nothing. Count and file store time is also part of the database and
+serialization time respectively, so the timings overlap and don't add up to the total.
+"""
+from contextlib import contextmanager, ExitStack
+from contextvars import ContextVar
+import time
+
+_timings = ContextVar('timings', default=None)
+
+
+class RequestTimings:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.metrics = {}
+
+    def record(self, name, duration):
+        count, total = self.metrics.get(name, (0, 0.0))
+        self.metrics[name] = (count + 1, total + duration)
+
+    def total_ms(self):
+        return (time.perf_counter() - self.start) * 1000
+
+    def as_tags(self):
+        """
+        Returns the number of calls and the milliseconds spent in each metric, and the total milliseconds,
+        as flat logging tags
+        """
+        tags = {}
+        for name, (count, total) in self.metrics.items():
+            tags['{}_count'.format(name)] = count
+            tags['{}_ms'.format(name)] = round(total * 1000, 3)
+        tags['total_ms'] = round(self.total_ms(), 3)
+        return tags
+
+    def server_timing(self):
+        """
+        Returns the timings as a Server-Timing header value
+        """
+        metrics = [
+            '{0};dur={1:.3f};desc="count={2}"'.format(name, total * 1000, count)
+            for name, (count, total) in self.metrics.items()
+        ]
+        metrics.append('total;dur={0:.3f}'.format(self.total_ms()))
+        return ', '.join(metrics)
+
+
+def start():
+    """
+    Start recording timings for the current context. Returns the timings and a token to pass to stop.
+    """
+    timings = RequestTimings()
+    return timings, _timings.set(timings)
+
+
+def stop(token):
+    _timings.reset(token)
+
+
+def record(name, duration):
+    timings = _timings.get()
+    if timings is not None:
+        timings.record(name, duration)
+
+
+@contextmanager
+def timed(name):
+    """
+    Records how long the block takes under the given name
+    """
+    if _timings.get() is None:
+        yield
+        return
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start_time)
+
+
+def database_timer(alias):
+    """
+    Returns a database execute wrapper that records the time of each query on the given alias
+    """
+    def execute_wrapper(execute, sql, params, many, context):
+        with timed('db_{}'.format(alias)):
+            return execute(sql, params, many, context)
+    return execute_wrapper
+
+
+class TimedFileStore:
+    """
+    Wraps a file store client to record the time of each call made to it
+    """
+    def __init__(self, file_store):
+        self.file_store = file_store
+
+    def __getattr__(self, name):
+        attribute = getattr(self.file_store, name)
+        if not callable(attribute):
+            return attribute
+
+        def timed_call(*args, **kwargs):
+            with timed('storage'):
+                return attribute(*args, **kwargs)
+        return timed_call
+
+    @contextmanager
+    def get_fileobj(self, *args, **kwargs):
+        # The file is downloaded when the context is entered
+        with ExitStack() as stack:
+            with timed('storage'):
+                fileobj = stack.enter_context(self.file_store.get_fileobj(*args, **kwargs))
+            yield fileobj
@@ -9,8 +9,11 @@ from django.views.generic import TemplateView
 
 from archive.frames import urls as frame_urls
 from archive.authentication import urls as auth_urls
-from archive.authentication.views import ObtainAuthTokenWithHeaders, HealthCheckView, RevokeApiTokenApiView
+from archive.authentication.views import (
+    ObtainAuthTokenWithHeaders, HealthCheckView, DeepHealthCheckView, RevokeApiTokenApiView
+)
 from archive.schema import ScienceArchiveSchemaGenerator
+from archive.metrics import metrics_view
 
 schema_view = get_schema_view(
    openapi.Info(
@@ -33,7 +36,9 @@ urlpatterns = [
     re_path(r'^api-auth/', include('rest_framework.urls', namespace='rest_framework')),
     re_path(r'^api-token-auth/', ObtainAuthTokenWithHeaders.as_view()),
     re_path(r'^revoke_token/', RevokeApiTokenApiView.as_view(), name='revoke_api_token'),
+    re_path(r'^health/deep/', DeepHealthCheckView.as_view(), name='deep-health'),
     re_path(r'^health/', HealthCheckView.as_view()),
+    path('metrics/', metrics_view, name='metrics'),
     path('openapi/', schema_view.as_view(), name='openapi-schema'),
     path('redoc/', TemplateView.as_view(
         template_name='redoc.html',
@@ -0,0 +1,26 @@
+"""
+Gunicorn hooks, loaded automatically when gunicorn is started from this directory.
+
+With PROMETHEUS_MULTIPROC_DIR set, every worker writes its metrics to files in that directory, which
+/metrics/ aggregates. The files of a previous run are cleared when gunicorn starts, and the live gauges
+of workers that exit are cleaned up.
+"""
+import glob
+import os
+
+
+def on_starting(server):
+    directory = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        for path in glob.glob(os.path.join(directory, '*.db')):
+            os.remove(path)
+
+
+def child_exit(server, worker):
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        try:
+            from prometheus_client import multiprocess
+        except ImportError:
+            return
+        multiprocess.mark_process_dead(worker.pid)